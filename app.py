@@ -1,129 +1,199 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session
-import sqlite3
+from flask import Flask, render_template, request, redirect, url_for, flash, session, Response, g, jsonify
 from werkzeug.security import generate_password_hash, check_password_hash
+from storage import open_storage, DuplicateError, StorageBusy
 import os
-import joblib
-import pandas as pd
-from datetime import datetime, timedelta
+import bisect
+import csv
+import gzip
+import time
+import click
+import itertools
+import math
+import smtplib
+import threading
+import warnings
+from email.message import EmailMessage
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
 import requests
 
 app = Flask(__name__)
-app.secret_key = "supersecretkey"
+app.secret_key = os.environ.get("SECRET_KEY", "supersecretkey")
 
 DB_NAME = "usersnew1.db"
-
-# Load ML model
-model = joblib.load("crop_recommendation_model.pkl")
+DATABASE_URL = os.environ.get("DATABASE_URL", f"sqlite:///{DB_NAME}")
+
+# ML model, loaded on first use so workers that never predict skip
+# importing joblib/scikit-learn and unpickling it
+MODEL_PATH = "crop_recommendation_model.pkl"
+MODEL_FEATURES = ["N", "P", "K", "temperature", "humidity", "ph", "rainfall"]
+_model = None
+_model_lock = threading.Lock()
+# Guards _warmup_thread only; _model_lock is held for the whole load, and
+# /ready must never wait on that
+_warmup_lock = threading.Lock()
+_warmup_thread = None
+
+# predict() passes plain rows instead of a DataFrame, which sklearn warns about
+warnings.filterwarnings("ignore", message="X does not have valid feature names",
+                        category=UserWarning, module="sklearn")
 
 # Weather API Key
 API_KEY = os.environ.get("WEATHER_API_KEY")
 
-# Initialize database
+# Retention (in days) for tables that only ever grow; 0 keeps rows forever
+RETENTION_DAYS = {
+    "auto_events": int(os.environ.get("AUTO_EVENTS_RETENTION_DAYS", 365)),
+    "predictions": int(os.environ.get("PREDICTIONS_RETENTION_DAYS", 730)),
+}
+# Column that decides when a row has expired
+RETENTION_DATE_COLUMN = {
+    "auto_events": "date",
+    "predictions": "created_at",
+}
+ARCHIVE_DIR = os.environ.get("ARCHIVE_DIR", "archive")
+ARCHIVE_BATCH_SIZE = 500
+
+# Daily reminder digests
+REMINDER_BATCH_SIZE = 500
+REMINDER_OUTBOX = os.environ.get("REMINDER_OUTBOX", "reminders.txt")
+SMTP_HOST = os.environ.get("SMTP_HOST", "localhost")
+SMTP_PORT = int(os.environ.get("SMTP_PORT", 25))
+REMINDER_SENDER = os.environ.get("REMINDER_SENDER", "reminders@localhost")
+
+# Admission control for /predict and /weather
+PREDICT_PER_MINUTE = int(os.environ.get("PREDICT_PER_MINUTE", 10))
+WEATHER_PER_MINUTE = int(os.environ.get("WEATHER_PER_MINUTE", 20))
+USER_BURST = int(os.environ.get("USER_BURST", 5))
+# Shared by all workers; keep under the OpenWeatherMap plan's calls/minute
+UPSTREAM_CALLS_PER_MINUTE = int(os.environ.get("UPSTREAM_CALLS_PER_MINUTE", 50))
+UPSTREAM_TIMEOUT = 5
+# An idle bucket is full again after this long, so prune-db can drop its row
+RATE_BUCKET_TTL = 60 * max(USER_BURST / min(PREDICT_PER_MINUTE, WEATHER_PER_MINUTE), 1)
+# Concurrent model.predict calls per worker process. Workers are threaded
+# (see Procfile) with more threads than this, so excess requests are shed.
+INFERENCE_CONCURRENCY = int(os.environ.get("INFERENCE_CONCURRENCY", 2))
+
+# ----------------- Database -----------------
+def get_storage():
+    # One storage session per request, closed by close_storage
+    if "storage" not in g:
+        g.storage = open_storage(DATABASE_URL)
+    return g.storage
+
+@app.teardown_appcontext
+def close_storage(exception):
+    storage = g.pop("storage", None)
+    if storage is not None:
+        storage.close()
+
+# Initialize / upgrade database
 def init_db():
-    if not os.path.exists(DB_NAME):
-        conn = sqlite3.connect(DB_NAME)
-        c = conn.cursor()
-
-        # Users table with role column
-        c.execute("""
-        CREATE TABLE users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            fullname TEXT NOT NULL,
-            email TEXT UNIQUE NOT NULL,
-            username TEXT UNIQUE NOT NULL,
-            password TEXT NOT NULL,
-            role TEXT NOT NULL DEFAULT 'user'
-        )
-        """)
-
-        # Predictions table
-        c.execute("""
-        CREATE TABLE predictions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            crop TEXT,
-            nitrogen REAL,
-            phosphorus REAL,
-            potassium REAL,
-            temperature REAL,
-            humidity REAL,
-            ph REAL,
-            rainfall REAL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY(user_id) REFERENCES users(id)
-        )
-        """)
-
-        # Crops table
-        c.execute("""
-        CREATE TABLE crops (
-           id INTEGER PRIMARY KEY AUTOINCREMENT,
-           name TEXT NOT NULL,
-           scientific_name TEXT,
-           category TEXT,
-           best_season TEXT,
-           optimal_growing_conditions TEXT,
-           growth_duration TEXT,
-           growing_stages TEXT,
-           pest_requirements TEXT,
-           water_required TEXT,
-           description TEXT,
-           image_url TEXT
-        )
-        """)
-        #crops_info
-        c.execute("""
-          CREATE TABLE IF NOT EXISTS crops_info (
-           id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            sowing_start TEXT,
-            sowing_end TEXT
-        )
-        """)
-        # Crop tasks
-        c.execute("""
-            CREATE TABLE IF NOT EXISTS crop_tasks (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                crop_id INTEGER NOT NULL,
-                task_type TEXT NOT NULL,
-                day_offset INTEGER NOT NULL,
-                notes TEXT,
-                FOREIGN KEY(crop_id) REFERENCES crops_info(id)
-            )
-        """)
-        # Custom events
-        c.execute("""
-           CREATE TABLE IF NOT EXISTS custom_events (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            title TEXT NOT NULL,
-            date TEXT NOT NULL,
-            notes TEXT,
-            FOREIGN KEY(user_id) REFERENCES users(id)
-            )
-        """)
-
-# Auto-generated events
-        c.execute("""
-         CREATE TABLE IF NOT EXISTS auto_events (
-           id INTEGER PRIMARY KEY AUTOINCREMENT,
-           user_id INTEGER,
-           title TEXT NOT NULL,
-           date TEXT NOT NULL,
-           notes TEXT,
-           crop_name TEXT,
-           FOREIGN KEY(user_id) REFERENCES users(id)
-           )
-        """)
-
-        conn.commit()
-        conn.close()
+    with open_storage(DATABASE_URL) as storage:
+        storage.migrate()
+
+init_db()
+
+def get_model():
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                import joblib
+                _model = joblib.load(MODEL_PATH)
+    return _model
+
+def _load_model_in_background():
+    global _warmup_thread
+    try:
+        get_model()
+    except Exception:
+        app.logger.exception("Loading the crop model from %s failed", MODEL_PATH)
+        # Let the next /ready call start a fresh attempt
+        with _warmup_lock:
+            _warmup_thread = None
+
+def warm_model():
+    # Load the model in the background; safe to call repeatedly
+    global _warmup_thread
+    with _warmup_lock:
+        if _model is None and _warmup_thread is None:
+            _warmup_thread = threading.Thread(target=_load_model_in_background, daemon=True)
+            _warmup_thread.start()
+
+# ----------------- Admission Control -----------------
+# Per-process counters, shown on /admin/limits
+admission_counters = defaultdict(int)
+_counters_lock = threading.Lock()
+inference_slots = threading.BoundedSemaphore(INFERENCE_CONCURRENCY)
+
+def inference_slot_free():
+    if inference_slots.acquire(blocking=False):
+        inference_slots.release()
+        return True
+    return False
+
+def count(name, delta=1):
+    with _counters_lock:
+        admission_counters[name] += delta
+
+def overloaded(status, message, retry_after):
+    return Response(message, status=status, headers={"Retry-After": str(math.ceil(retry_after))})
+
+def admit(endpoint, per_minute, upstream_calls):
+    """Return a 429/503 response if this request should be shed, else None."""
+    try:
+        return _admit(endpoint, per_minute, upstream_calls)
+    except StorageBusy:
+        # The limiter couldn't get the database lock quickly: shed, don't queue
+        count(f"{endpoint}.rejected_busy")
+        return overloaded(503, "Server is busy, please try again shortly.", 1)
+
+def _admit(endpoint, per_minute, upstream_calls):
+    rate_limits = get_storage().rate_limits
+    user_key = f"user:{session['user_id']}:{endpoint}"
+    wait = rate_limits.take(user_key, per_minute, USER_BURST)
+    if wait:
+        count(f"{endpoint}.rejected_user")
+        return overloaded(429, "Too many requests, please slow down.", wait)
+
+    wait = rate_limits.take("upstream:openweathermap", UPSTREAM_CALLS_PER_MINUTE,
+                            UPSTREAM_CALLS_PER_MINUTE, cost=upstream_calls)
+    if wait:
+        # Not the user's fault, so don't charge them for it
+        rate_limits.refund(user_key, USER_BURST)
+        count(f"{endpoint}.rejected_upstream")
+        return overloaded(503, "Weather service is busy, please try again shortly.", wait)
+
+    count(f"{endpoint}.admitted")
+    return None
+
+@app.route('/admin/limits')
+def admission_stats():
+    if session.get('role') != 'admin':
+        flash("Unauthorized access!", "danger")
+        return redirect(url_for('index'))
+    buckets = get_storage().rate_limits.list_buckets("upstream:")
+    return jsonify({
+        "counters": dict(admission_counters),
+        "upstream_buckets": [b._asdict() for b in buckets],
+        "limits": {
+            "predict_per_minute": PREDICT_PER_MINUTE,
+            "weather_per_minute": WEATHER_PER_MINUTE,
+            "user_burst": USER_BURST,
+            "upstream_calls_per_minute": UPSTREAM_CALLS_PER_MINUTE,
+            "inference_concurrency": INFERENCE_CONCURRENCY,
+        },
+    })
 
 # Weather API
 def get_weather_forecast(location):
     # Get latitude & longitude from city/district name
     geocode_url = f"http://api.openweathermap.org/geo/1.0/direct?q={location},IN&limit=1&appid={API_KEY}"
-    geo_response = requests.get(geocode_url)
+    try:
+        geo_response = requests.get(geocode_url, timeout=UPSTREAM_TIMEOUT)
+    except requests.RequestException:
+        return None
 
     if geo_response.status_code != 200 or not geo_response.json():
         return None
@@ -133,7 +203,10 @@ def get_weather_forecast(location):
 
     # Use 5-day forecast API (3-hour intervals)
     url = f"http://api.openweathermap.org/data/2.5/forecast?lat={lat}&lon={lon}&appid={API_KEY}&units=metric"
-    response = requests.get(url)
+    try:
+        response = requests.get(url, timeout=UPSTREAM_TIMEOUT)
+    except requests.RequestException:
+        return None
 
     if response.status_code != 200:
         return None
@@ -177,24 +250,18 @@ def signup():
 
         hashed_pw = generate_password_hash(password)
 
-        conn = sqlite3.connect(DB_NAME)
-        c = conn.cursor()
-        c.execute("SELECT id FROM users WHERE email=?", (email,))
-        if c.fetchone():
+        users = get_storage().users
+        if users.get_by_email(email):
            flash("Email already registered. Please use another email.", "danger")
            return redirect(url_for('signup'))
 
         try:
-            c.execute("INSERT INTO users (fullname, email, username, password, role) VALUES (?, ?, ?, ?, ?)",
-                      (fullname, email, username, hashed_pw, "user"))
-            conn.commit()
+            users.add(fullname, email, username, hashed_pw, "user")
             flash("Account created successfully! Please log in.", "success")
             return redirect(url_for('login'))
-        except sqlite3.IntegrityError:
+        except DuplicateError:
             flash("Username or Email already exists!", "danger")
             return redirect(url_for('signup'))
-        finally:
-            conn.close()
 
     return render_template('signup.html')
 
@@ -205,21 +272,16 @@ def login():
         email = request.form['email']
         password = request.form['password']
 
-        conn = sqlite3.connect(DB_NAME)
-        c = conn.cursor()
-        c.execute("SELECT * FROM users WHERE email = ?", (email,))
-
-        user = c.fetchone()
-        conn.close()
+        user = get_storage().users.get_by_email(email)
 
-        if user and check_password_hash(user[4], password):
-            session['user_id'] = user[0]
-            session['username'] = user[3]
-            session['role'] = user[5]
+        if user and check_password_hash(user.password, password):
+            session['user_id'] = user.id
+            session['username'] = user.username
+            session['role'] = user.role
 
-            flash(f"Welcome, {user[1]}!", "success")
+            flash(f"Welcome, {user.fullname}!", "success")
 
-            if user[5] == "admin":
+            if user.role == "admin":
                 return redirect(url_for('admin_dashboard'))
             else:
                 return redirect(url_for('index'))
@@ -246,6 +308,17 @@ def predict():
         ph = float(request.form['ph'])
         location = request.form['location']
 
+        # Shed before spending the user's tokens or the upstream budget if
+        # inference is already saturated
+        if not inference_slot_free():
+            count("inference.rejected")
+            return overloaded(503, "Server is busy, please try again shortly.", 1)
+
+        # Geocoding + forecast: two upstream calls
+        rejected = admit("predict", PREDICT_PER_MINUTE, upstream_calls=2)
+        if rejected:
+            return rejected
+
         weather = get_weather_forecast(location)
         if not weather:
             flash("Weather API error! Please check your city name.", "danger")
@@ -253,7 +326,7 @@ def predict():
 
         temperature, humidity, rainfall = weather
 
-        input_data = pd.DataFrame([{
+        features = {
             'N': N,
             'P': P,
             'K': K,
@@ -261,24 +334,38 @@ def predict():
             'humidity': humidity,
             'ph': ph,
             'rainfall': rainfall
-        }])
+        }
 
-        result = model.predict(input_data)[0]
+        # The slot covers only the model call, so slow weather lookups can't
+        # starve inference; shed rather than queue if they all filled up
+        # while this request was waiting on the weather service
+        if not inference_slots.acquire(blocking=False):
+            count("inference.rejected")
+            return overloaded(503, "Server is busy, please try again shortly.", 1)
+        try:
+            count("inference.in_flight")
+            model = get_model()
+            columns = getattr(model, "feature_names_in_", MODEL_FEATURES)
+            result = model.predict([[features[name] for name in columns]])[0]
+        finally:
+            count("inference.in_flight", -1)
+            inference_slots.release()
 
-        conn = sqlite3.connect(DB_NAME)
-        c = conn.cursor()
-        c.execute("""
-            INSERT INTO predictions (user_id, crop, nitrogen, phosphorus, potassium, temperature, humidity, ph, rainfall)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (session['user_id'], result, N, P, K, temperature, humidity, ph, rainfall))
-        conn.commit()
-        conn.close()
+        get_storage().predictions.add(session['user_id'], result, N, P, K, temperature, humidity, ph, rainfall)
 
     return render_template('predict.html', result=result,
                            temperature=temperature,
                            humidity=humidity,
                            rainfall=rainfall)
 
+# Readiness probe: 503 until the model is loaded, warming it in the background
+@app.route('/ready')
+def ready():
+    if _model is None:
+        warm_model()
+        return Response("warming up", status=503, headers={"Retry-After": "5"})
+    return Response("ready", status=200)
+
 # ---------------- ADMIN PANEL ----------------
 @app.route('/admin')
 def admin_dashboard():
@@ -291,11 +378,7 @@ def admin_dashboard():
 def manage_crops():
     if session.get('role') != 'admin':
         return redirect(url_for('index'))
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("SELECT * FROM crops")
-    crops = c.fetchall()
-    conn.close()
+    crops = get_storage().crops.list_all()
     return render_template('manage_crops.html', crops=crops)
 
 @app.route('/admin/crops/add', methods=['GET', 'POST'])
@@ -315,19 +398,11 @@ def add_crop():
      description = request.form['description']
      image_url = request.form['image_url']
 
-     conn = sqlite3.connect(DB_NAME)
-     c = conn.cursor()
-     c.execute("""
-        INSERT INTO crops 
-        (name, scientific_name, category, best_season, optimal_growing_conditions, 
-         growth_duration, growing_stages, pest_requirements, water_required, 
-         description, image_url)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-     """, (name, scientific_name, category, best_season, optimal_growing_conditions,
-          growth_duration, growing_stages, pest_requirements, water_required,
-          description, image_url))
-     conn.commit()
-     conn.close()
+     get_storage().crops.add(
+         name=name, scientific_name=scientific_name, category=category, best_season=best_season,
+         optimal_growing_conditions=optimal_growing_conditions, growth_duration=growth_duration,
+         growing_stages=growing_stages, pest_requirements=pest_requirements,
+         water_required=water_required, description=description, image_url=image_url)
      flash("Crop added successfully!", "success")
      return redirect(url_for('manage_crops'))
 
@@ -338,13 +413,10 @@ def update_crop(crop_id):
     if session.get('role') != 'admin':
         return redirect(url_for('index'))
 
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row  # So we can use dict-like access
-    c = conn.cursor()
+    crops = get_storage().crops
 
     # Fetch crop
-    c.execute("SELECT * FROM crops WHERE id=?", (crop_id,))
-    crop = c.fetchone()
+    crop = crops.get(crop_id)
 
     if request.method == 'POST':
         name = request.form['name']
@@ -359,21 +431,15 @@ def update_crop(crop_id):
         description = request.form['description']
         image_url = request.form['image_url']
 
-        c.execute("""
-            UPDATE crops 
-            SET name=?, scientific_name=?, category=?, best_season=?, 
-                optimal_growing_conditions=?, growth_duration=?, growing_stages=?, 
-                pest_requirements=?, water_required=?, description=?, image_url=?
-            WHERE id=?
-        """, (name, scientific_name, category, best_season,
-              optimal_growing_conditions, growth_duration, growing_stages,
-              pest_requirements, water_required, description, image_url, crop_id))
-        conn.commit()
-        conn.close()
+        crops.update(
+            crop_id, name=name, scientific_name=scientific_name, category=category,
+            best_season=best_season, optimal_growing_conditions=optimal_growing_conditions,
+            growth_duration=growth_duration, growing_stages=growing_stages,
+            pest_requirements=pest_requirements, water_required=water_required,
+            description=description, image_url=image_url)
         flash("Crop updated successfully!", "success")
         return redirect(url_for('manage_crops'))
 
-    conn.close()
     return render_template('update_crop.html', crop=crop)
 
 
@@ -381,11 +447,7 @@ def update_crop(crop_id):
 def delete_crop(crop_id):
     if session.get('role') != 'admin':
         return redirect(url_for('index'))
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("DELETE FROM crops WHERE id=?", (crop_id,))
-    conn.commit()
-    conn.close()
+    get_storage().crops.delete(crop_id)
     flash("Crop deleted successfully!", "info")
     return redirect(url_for('manage_crops'))
 
@@ -396,22 +458,13 @@ def feature1():
         flash("Please log in to access Feature 1.", "warning")
         return redirect(url_for('login'))
         
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("SELECT * FROM crops")
-    crops = c.fetchall()
-    conn.close()
+    crops = get_storage().crops.list_all()
     return render_template('feature1.html', crops=crops)
 
 
 @app.route('/crop/<int:crop_id>')
 def crop_detail(crop_id):
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row  # allows dict-like access
-    c = conn.cursor()
-    c.execute("SELECT * FROM crops WHERE id=?", (crop_id,))
-    crop = c.fetchone()
-    conn.close()
+    crop = get_storage().crops.get(crop_id)
     return render_template('crop_detail.html', crop=crop)
 
 
@@ -428,9 +481,18 @@ def weather():
             flash("Please enter a city.", "danger")
             return redirect(url_for('weather'))
 
+        # Current weather + forecast: two upstream calls
+        rejected = admit("weather", WEATHER_PER_MINUTE, upstream_calls=2)
+        if rejected:
+            return rejected
+
         # Current weather
         current_url = f"http://api.openweathermap.org/data/2.5/weather?q={city}&appid={API_KEY}&units=metric"
-        current_response = requests.get(current_url).json()
+        try:
+            current_response = requests.get(current_url, timeout=UPSTREAM_TIMEOUT).json()
+        except requests.RequestException:
+            flash("Weather service is unavailable, please try again later.", "danger")
+            return redirect(url_for('weather'))
 
         if current_response.get("cod") != 200:
             flash("City not found! Try again.", "danger")
@@ -448,7 +510,11 @@ def weather():
 
         # Forecast (next 7 days, pick 12:00 PM if available)
         forecast_url = f"http://api.openweathermap.org/data/2.5/forecast?q={city}&appid={API_KEY}&units=metric"
-        forecast_response = requests.get(forecast_url).json()
+        try:
+            forecast_response = requests.get(forecast_url, timeout=UPSTREAM_TIMEOUT).json()
+        except requests.RequestException:
+            flash("Weather service is unavailable, please try again later.", "danger")
+            return redirect(url_for('weather'))
 
         forecast_list = []
         added_dates = set()
@@ -481,40 +547,103 @@ def home():
         return redirect(url_for('login'))
 
     today = datetime.today().date()
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row  # for dict-like access
-    c = conn.cursor()
-
-    c.execute("SELECT * FROM custom_events WHERE user_id=?", (session['user_id'],))
-    custom_events = c.fetchall()
-    c.execute("SELECT * FROM auto_events WHERE user_id=?", (session['user_id'],))
-    auto_events = c.fetchall()
-    conn.close()
+    storage = get_storage()
+    custom_events = storage.custom_events.list_for_user(session['user_id'])
+    auto_events = storage.auto_events.list_for_user(session['user_id'])
 
     custom_list = [
-        {"id": e["id"], "title": e["title"], "start": e["date"], "notes": e["notes"], "type": "custom"}
-        for e in custom_events if datetime.strptime(e["date"], "%Y-%m-%d").date() >= today
+        {"id": e.id, "title": e.title, "start": e.date, "notes": e.notes, "type": "custom"}
+        for e in custom_events if datetime.strptime(e.date, "%Y-%m-%d").date() >= today
     ]
 
     auto_list = [
-        {"id": e["id"], "title": e["title"], "start": e["date"], "notes": e["notes"], "type": "auto"}
-        for e in auto_events if datetime.strptime(e["date"], "%Y-%m-%d").date() >= today
+        {"id": e.id, "title": e.title, "start": e.date, "notes": e.notes, "type": "auto"}
+        for e in auto_events if datetime.strptime(e.date, "%Y-%m-%d").date() >= today
     ]
 
     all_events = custom_list + auto_list
-    return render_template("home.html", events=all_events)
+    feed_url = url_for("calendar_feed", token=storage.calendar.feed_token(session['user_id']), _external=True)
+    return render_template("home.html", events=all_events, feed_url=feed_url)
+
+# ----------------- Calendar Subscription (ICS) -----------------
+def ics_escape(text):
+    # CRLF and bare CR would end the content line, so fold them into \n first
+    text = (text or "").replace("\r\n", "\n").replace("\r", "\n")
+    return text.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,").replace("\n", "\\n")
+
+def ics_line(line):
+    # RFC 5545 folds lines longer than 75 octets
+    data = line.encode("utf-8")
+    if len(data) <= 75:
+        return line + "\r\n"
+    parts = []
+    # Continuation lines start with a space, leaving 74 octets of content
+    while len(data) > (75 if not parts else 74):
+        cut = 75 if not parts else 74
+        while (data[cut] & 0xC0) == 0x80:  # don't split a UTF-8 sequence
+            cut -= 1
+        parts.append(data[:cut].decode("utf-8"))
+        data = data[cut:]
+    parts.append(data.decode("utf-8"))
+    return "\r\n ".join(parts) + "\r\n"
+
+def generate_ics(user_id):
+    # Runs after the request has ended, so it can't use get_storage()
+    storage = open_storage(DATABASE_URL)
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    try:
+        yield ics_line("BEGIN:VCALENDAR")
+        yield ics_line("VERSION:2.0")
+        yield ics_line("PRODID:-//Crop Recommendation System//Crop Calendar//EN")
+        yield ics_line("X-WR-CALNAME:Crop Calendar")
+        for kind, event_id, title, date, notes in storage.calendar.iter_events(user_id):
+            start = datetime.strptime(date, "%Y-%m-%d")
+            yield (ics_line("BEGIN:VEVENT")
+                   + ics_line(f"UID:{kind}-{event_id}@crop-app")
+                   + ics_line(f"DTSTAMP:{stamp}")
+                   + ics_line(f"DTSTART;VALUE=DATE:{start:%Y%m%d}")
+                   + ics_line(f"DTEND;VALUE=DATE:{start + timedelta(days=1):%Y%m%d}")
+                   + ics_line(f"SUMMARY:{ics_escape(title)}")
+                   + ics_line(f"DESCRIPTION:{ics_escape(notes)}")
+                   + ics_line("END:VEVENT"))
+        yield ics_line("END:VCALENDAR")
+    finally:
+        storage.close()
+
+@app.route("/calendar/<token>.ics")
+def calendar_feed(token):
+    calendar = get_storage().calendar
+    user_id = calendar.user_for_feed_token(token)
+    if user_id is None:
+        return Response("Invalid calendar link", status=404)
+
+    etag = f"{user_id}-{calendar.version(user_id)}"
+
+    # Unchanged since the client's last poll: answer without reading events
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(generate_ics(user_id), mimetype="text/calendar")
+        response.headers["Content-Disposition"] = "inline; filename=crop-calendar.ics"
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "private, max-age=300"
+    return response
+
+@app.route("/calendar/rotate", methods=["POST"])
+def rotate_calendar_feed():
+    if 'user_id' not in session:
+        return redirect(url_for('login'))
+
+    get_storage().calendar.rotate_feed_token(session['user_id'])
+    flash("Calendar link reset. Subscribe again with the new link; the old one no longer works.", "info")
+    return redirect(url_for("home"))
 
 # ----------------- Day View -----------------
 @app.route("/day/<date>")
 def day_view(date):
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row
-    c = conn.cursor()
-    c.execute("SELECT * FROM custom_events WHERE date=?", (date,))
-    custom_events = c.fetchall()
-    c.execute("SELECT * FROM auto_events WHERE date=?", (date,))
-    auto_events = c.fetchall()
-    conn.close()
+    storage = get_storage()
+    custom_events = storage.custom_events.list_on_date(date)
+    auto_events = storage.auto_events.list_on_date(date)
 
     return render_template("day_view.html", date=date,
                            custom_events=custom_events,
@@ -523,93 +652,191 @@ def day_view(date):
 # ----------------- Delete Event -----------------
 @app.route("/delete_event/<int:event_id>")
 def delete_event(event_id):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("DELETE FROM custom_events WHERE id=?", (event_id,))
-    conn.commit()
-    conn.close()
+    get_storage().custom_events.delete(event_id)
     flash("Event deleted successfully!", "success")
     return redirect(url_for("home"))
 
 @app.route("/delete_auto_event/<int:event_id>", methods=["POST"])
 def delete_auto_event(event_id):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("DELETE FROM auto_events WHERE id=?", (event_id,))
-    conn.commit()
-    conn.close()
+    get_storage().auto_events.delete(event_id)
     flash("Auto event removed successfully!", "success")
     return redirect(url_for("auto_events_list"))
 
+# ----------------- Sowing Window Index -----------------
+def day_of_year(month_day):
+    # "MM-DD" -> 1..366, using a leap year so 02-29 is valid
+    return datetime.strptime(f"2000-{month_day}", "%Y-%m-%d").timetuple().tm_yday
+
+class SowingIndex:
+    """Which crops_info rows can be sown on a day of the year.
+
+    Window edges split the year into at most 367 segments, each holding the
+    set of crops sowable throughout it, so a day is answered with one bisect.
+    Cross-year windows (e.g. 10-15 to 02-10) are stored as two pieces.
+    Crops without a window can be sown any day, as in generate_auto_events.
+    Rows whose window isn't MM-DD are left out and listed in self.invalid.
+    """
+
+    def __init__(self, crops):
+        self.names = {}
+        self.invalid = []
+        pieces = []
+        for crop in crops:
+            if crop.sowing_start and crop.sowing_end:
+                try:
+                    start = day_of_year(crop.sowing_start)
+                    end = day_of_year(crop.sowing_end)
+                except ValueError:
+                    self.invalid.append(crop.name)
+                    continue
+            else:
+                start, end = 1, 366
+            self.names[crop.id] = crop.name
+            if start <= end:
+                pieces.append((start, end, crop.id))
+            else:
+                pieces.append((start, 366, crop.id))
+                pieces.append((1, end, crop.id))
+
+        self.boundaries = sorted({1} | {start for start, _, _ in pieces} | {end + 1 for _, end, _ in pieces})
+        segments = [set() for _ in self.boundaries]
+        for start, end, crop_id in pieces:
+            first = bisect.bisect_left(self.boundaries, start)
+            last = bisect.bisect_left(self.boundaries, end + 1)
+            for i in range(first, last):
+                segments[i].add(crop_id)
+        self.segments = [frozenset(ids) for ids in segments]
+
+        pieces.sort()
+        self.starts = [start for start, _, _ in pieces]
+        self.start_ids = [crop_id for _, _, crop_id in pieces]
+
+    def crops_on(self, day):
+        return self.segments[bisect.bisect_right(self.boundaries, day) - 1]
+
+    def crops_between(self, first_day, last_day):
+        if first_day > last_day:
+            # Range wraps past the end of the year
+            return self.crops_between(first_day, 366) | self.crops_between(1, last_day)
+        # Windows open on first_day, plus windows that open later in the range
+        lo = bisect.bisect_right(self.starts, first_day)
+        hi = bisect.bisect_right(self.starts, last_day)
+        return self.crops_on(first_day) | frozenset(self.start_ids[lo:hi])
+
+    def names_for(self, crop_ids):
+        return sorted({self.names[crop_id] for crop_id in crop_ids})
+
+_sowing_index = None
+_sowing_index_version = None
+
+def get_sowing_index(storage):
+    # Rebuilt whenever add/edit/delete_crop_cal bump the crops_info version,
+    # including when another worker made the change
+    global _sowing_index, _sowing_index_version
+    version = storage.crops_info.version()
+    if _sowing_index is None or version != _sowing_index_version:
+        _sowing_index = SowingIndex(storage.crops_info.list_all())
+        _sowing_index_version = version
+        if _sowing_index.invalid:
+            app.logger.warning("Ignoring crops_info rows with sowing windows not in MM-DD format: %s",
+                               ", ".join(_sowing_index.invalid))
+    return _sowing_index
+
+def sowable_crops(storage, start_date, end_date=None):
+    # Names of crops sowable on start_date, or on any day up to end_date
+    index = get_sowing_index(storage)
+    first = day_of_year(start_date.strftime("%m-%d"))
+    if end_date is None:
+        return index.names_for(index.crops_on(first))
+    if (end_date - start_date).days >= 365:
+        return index.names_for(index.names)
+    last = day_of_year(end_date.strftime("%m-%d"))
+    return index.names_for(index.crops_between(first, last))
+
+@app.route("/api/sowable")
+def api_sowable():
+    try:
+        start = datetime.strptime(request.args["date"], "%Y-%m-%d").date()
+        end = request.args.get("end")
+        end = datetime.strptime(end, "%Y-%m-%d").date() if end else None
+    except (KeyError, ValueError):
+        return jsonify({"error": "Use ?date=YYYY-MM-DD, optionally with &end=YYYY-MM-DD"}), 400
+    if end and end < start:
+        return jsonify({"error": "end must not be before date"}), 400
+
+    crops = sowable_crops(get_storage(), start, end)
+    return jsonify({"date": start.isoformat(), "end": end.isoformat() if end else None, "crops": crops})
+
+def valid_month_day(value):
+    try:
+        day_of_year(value)
+        return True
+    except ValueError:
+        return False
+
+def sowing_window(sowing_start, sowing_end):
+    # Both MM-DD, or both empty for a crop that can be sown any day;
+    # returns None for anything else
+    sowing_start = (sowing_start or "").strip() or None
+    sowing_end = (sowing_end or "").strip() or None
+    if sowing_start is None and sowing_end is None:
+        return None, None
+    if sowing_start and sowing_end and valid_month_day(sowing_start) and valid_month_day(sowing_end):
+        return sowing_start, sowing_end
+    return None
+
 # ----------------- Admin Page -----------------
 @app.route("/admin_cal")
 def admin_cal():
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row
-    c = conn.cursor()
-    c.execute("SELECT * FROM crops_info")
-    crops = c.fetchall()
-    conn.close()
+    crops = get_storage().crops_info.list_all()
     return render_template("admin_cal.html", crops=crops)
 
 
 @app.route("/add_crop_cal", methods=["POST"])
 def add_crop_cal():
     name = request.form["name"]
-    sowing_start = request.form["sowing_start"]
-    sowing_end = request.form["sowing_end"]
-
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("INSERT INTO crops_info (name, sowing_start, sowing_end) VALUES (?, ?, ?)", 
-              (name, sowing_start, sowing_end))
-    conn.commit()
-    conn.close()
+    window = sowing_window(request.form.get("sowing_start"), request.form.get("sowing_end"))
+
+    if window is None:
+        flash("Sowing dates must both be in MM-DD format, or both left empty.", "danger")
+        return redirect(url_for("admin_cal"))
+
+    get_storage().crops_info.add(name, *window)
     flash("Crop added successfully!", "success")
     return redirect(url_for("admin_cal"))
 
 
 @app.route("/edit_crop_cal/<int:crop_id>", methods=["GET", "POST"])
 def edit_crop_cal(crop_id):
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row
-    c = conn.cursor()
-    c.execute("SELECT * FROM crops_info WHERE id=?", (crop_id,))
-    crop = c.fetchone()
+    crops_info = get_storage().crops_info
+    crop = crops_info.get(crop_id)
 
     if request.method == "POST":
         name = request.form["name"]
-        c.execute("UPDATE crops_info SET name=? WHERE id=?", (name, crop_id))
-        conn.commit()
-        conn.close()
+        window = sowing_window(request.form.get("sowing_start", crop.sowing_start),
+                               request.form.get("sowing_end", crop.sowing_end))
+        if window is None:
+            flash("Sowing dates must both be in MM-DD format, or both left empty.", "danger")
+            return redirect(url_for("edit_crop_cal", crop_id=crop_id))
+
+        crops_info.update(crop_id, name, *window)
         flash("Crop updated successfully!", "success")
         return redirect(url_for("admin_cal"))
 
-    conn.close()
     return render_template("edit_crop.html", crop=crop)
 
 @app.route("/delete_crop_cal/<int:crop_id>")
 def delete_crop_cal(crop_id):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("DELETE FROM crop_tasks WHERE crop_id=?", (crop_id,))
-    c.execute("DELETE FROM crops_info WHERE id=?", (crop_id,))
-    conn.commit()
-    conn.close()
+    get_storage().crops_info.delete(crop_id)
     flash("Crop deleted successfully!", "success")
     return redirect(url_for("admin_cal"))
 
 # ----------------- Crop Tasks -----------------
 @app.route("/crop_tasks/<int:crop_id>/tasks")
 def crop_tasks(crop_id):
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row
-    c = conn.cursor()
-    c.execute("SELECT * FROM crops_info WHERE id=?", (crop_id,))
-    crop = c.fetchone()
-    c.execute("SELECT * FROM crop_tasks WHERE crop_id=?", (crop_id,))
-    tasks = c.fetchall()
-    conn.close()
+    storage = get_storage()
+    crop = storage.crops_info.get(crop_id)
+    tasks = storage.crop_tasks.list_for_crop(crop_id)
     return render_template("crop_tasks.html", crop=crop, tasks=tasks)
 
 @app.route("/add_task", methods=["POST"])
@@ -619,24 +846,13 @@ def add_task():
     day_offset = int(request.form["day_offset"])
     notes = request.form.get("notes", "")
 
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("INSERT INTO crop_tasks (crop_id, task_type, day_offset, notes) VALUES (?, ?, ?, ?)",
-              (crop_id, task_type, day_offset, notes))
-    conn.commit()
-    conn.close()
+    get_storage().crop_tasks.add(crop_id, task_type, day_offset, notes)
     flash("Task added successfully!", "success")
     return redirect(url_for("crop_tasks", crop_id=crop_id))
 
 @app.route("/delete_task/<int:task_id>")
 def delete_task(task_id):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("SELECT crop_id FROM crop_tasks WHERE id=?", (task_id,))
-    crop_id = c.fetchone()[0]
-    c.execute("DELETE FROM crop_tasks WHERE id=?", (task_id,))
-    conn.commit()
-    conn.close()
+    crop_id = get_storage().crop_tasks.delete(task_id)
     flash("Task deleted successfully!", "success")
     return redirect(url_for("crop_tasks", crop_id=crop_id))
 
@@ -647,25 +863,18 @@ def custom_events():
         flash("Please log in first.", "danger")
         return redirect(url_for("login"))
 
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row
-    c = conn.cursor()
+    custom_events = get_storage().custom_events
 
     if request.method == "POST":
         title = request.form["title"]
         date = request.form["date"]
         notes = request.form.get("notes", "")
-        c.execute("INSERT INTO custom_events (user_id, title, date, notes) VALUES (?, ?, ?, ?)",
-                  (session['user_id'], title, date, notes))
-        conn.commit()
-        conn.close()
+        custom_events.add(session['user_id'], title, date, notes)
         flash("Custom event added!", "success")
         return redirect(url_for("custom_events"))
 
     # 🔹 FIXED: Only fetch events of current user
-    c.execute("SELECT * FROM custom_events WHERE user_id=?", (session['user_id'],))
-    events = c.fetchall()
-    conn.close()
+    events = custom_events.list_for_user(session['user_id'])
     return render_template("custom_events.html", events=events)
 
 # ----------------- Auto Events -----------------
@@ -680,7 +889,17 @@ def auto_events():
         sowing_date = request.form["sowing_date"]
         return redirect(url_for("generate_auto_events", crop_name=crop_name, sowing_date=sowing_date))
 
-    return render_template("auto_events.html")
+    # "What can I sow on this date?" lookup for the form
+    sowing_date = request.args.get("date")
+    sowable = None
+    if sowing_date:
+        try:
+            sowable = sowable_crops(get_storage(), datetime.strptime(sowing_date, "%Y-%m-%d").date())
+        except ValueError:
+            flash("Please pick a valid date.", "danger")
+            sowing_date = None
+
+    return render_template("auto_events.html", sowing_date=sowing_date, sowable=sowable)
 
 
 
@@ -688,51 +907,28 @@ def auto_events():
 def generate_auto_events(crop_name, sowing_date):
     sowing_date_obj = datetime.strptime(sowing_date, "%Y-%m-%d")
 
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row
-    c = conn.cursor()
-    c.execute("SELECT * FROM crops_info WHERE name=?", (crop_name,))
-    crop = c.fetchone()
+    storage = get_storage()
+    crop = storage.crops_info.get_by_name(crop_name)
 
     if not crop:
         flash("Crop not found!", "danger")
-        conn.close()
         return redirect(url_for("auto_events"))
 
-    # ✅ Season check (handles cross-year ranges like Oct–Feb)
-    if crop["sowing_start"] and crop["sowing_end"]:
-        sowing_md = sowing_date_obj.strftime("%m-%d")
-
-        start_md = crop["sowing_start"]
-        end_md = crop["sowing_end"]
-
-        start = datetime.strptime(start_md, "%m-%d")
-        end = datetime.strptime(end_md, "%m-%d")
-        test = datetime.strptime(sowing_md, "%m-%d")
-
-        if start <= end:
-            # ✅ Normal case (e.g., Jun–Jul, Oct–Dec)
-            in_season = (start <= test <= end)
-        else:
-            # ✅ Cross-year case (e.g., Oct–Feb)
-            in_season = (test >= start or test <= end)
-
-        if not in_season:
-            flash(f"{crop_name} can only be sown between {start_md} and {end_md}.", "danger")
-            conn.close()
-            return redirect(url_for("auto_events"))
+    # ✅ Season check (the index handles cross-year ranges like Oct–Feb)
+    index = get_sowing_index(storage)
+    if crop.id not in index.names:
+        flash(f"{crop_name} has a sowing window that isn't in MM-DD format; ask an admin to fix it.", "danger")
+        return redirect(url_for("auto_events"))
+    if crop.id not in index.crops_on(day_of_year(sowing_date_obj.strftime("%m-%d"))):
+        flash(f"{crop_name} can only be sown between {crop.sowing_start} and {crop.sowing_end}.", "danger")
+        return redirect(url_for("auto_events"))
 
     # ✅ If within season, generate events
     auto_events = generate_crop_events(crop_name, sowing_date)
-    for ev in auto_events:
-        notes = ev.get("notes", "")
-        c.execute("""
-            INSERT INTO auto_events (user_id, title, date, notes, crop_name) 
-            VALUES (?, ?, ?, ?, ?)
-        """, (session['user_id'], ev["title"], ev["start"], notes, crop_name))
-
-    conn.commit()
-    conn.close()
+    storage.auto_events.add_many(
+        session['user_id'], crop_name,
+        [(ev["title"], ev["start"], ev.get("notes", "")) for ev in auto_events])
+
     flash("Auto events generated successfully!", "success")
     return redirect(url_for("auto_events_list"))
 
@@ -744,37 +940,27 @@ def auto_events_list():
         flash("Please log in first.", "danger")
         return redirect(url_for("login"))
 
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row
-    c = conn.cursor()
     # 🔹 FIXED: Only fetch auto events of current user
-    c.execute("SELECT * FROM auto_events WHERE user_id=?", (session['user_id'],))
-    auto_events = c.fetchall()
-    conn.close()
+    auto_events = get_storage().auto_events.list_for_user(session['user_id'])
     return render_template("auto_events_list.html", auto_events=auto_events)
 
 # ----------------- Function to generate crop events -----------------
 def generate_crop_events(crop_name, sowing_date_str):
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row
-    c = conn.cursor()
-    c.execute("SELECT * FROM crops_info WHERE name=?", (crop_name,))
-    crop = c.fetchone()
+    storage = get_storage()
+    crop = storage.crops_info.get_by_name(crop_name)
     if not crop:
         return []
 
     sowing_date = datetime.strptime(sowing_date_str, "%Y-%m-%d")
-    c.execute("SELECT * FROM crop_tasks WHERE crop_id=?", (crop["id"],))
-    tasks = c.fetchall()
-    conn.close()
+    tasks = storage.crop_tasks.list_for_crop(crop.id)
 
     events = []
     for t in tasks:
-        event_date = sowing_date + timedelta(days=t["day_offset"])
+        event_date = sowing_date + timedelta(days=t.day_offset)
         events.append({
-            "title": t["task_type"],
+            "title": t.task_type,
             "start": event_date.strftime("%Y-%m-%d"),
-            "notes": t["notes"]
+            "notes": t.notes
         })
     return events
 
@@ -786,20 +972,15 @@ def manage_roles():
         flash("Unauthorized access!", "danger")
         return redirect(url_for('index'))
 
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row
-    c = conn.cursor()
+    users = get_storage().users
 
     if request.method == "POST":
         user_id = request.form.get("user_id")
         new_role = request.form.get("role")
-        c.execute("UPDATE users SET role = ? WHERE id = ?", (new_role, user_id))
-        conn.commit()
+        users.set_role(user_id, new_role)
         flash("User role updated successfully!", "success")
 
-    c.execute("SELECT id, fullname, username, email, role FROM users")
-    users = c.fetchall()
-    conn.close()
+    users = users.list_all()
 
     return render_template("manage_roles.html", users=users)
 
@@ -810,8 +991,198 @@ def logout():
     flash("You have been logged out.", "info")
     return redirect(url_for('login'))
 
+# ----------------- Maintenance -----------------
+def write_archive(table, records):
+    # Each batch becomes its own file in a month partition, e.g.
+    # archive/predictions/2024-05/1201-1700.csv.gz. It's written under a .tmp
+    # name and only published once the rows are deleted (see publish_archive),
+    # so a run that dies in between never archives the same rows twice.
+    date_col = RETENTION_DATE_COLUMN[table]
+    partitions = {}
+    for record in records:
+        partitions.setdefault(str(getattr(record, date_col))[:7], []).append(record)
+
+    pending = []
+    for month, month_records in partitions.items():
+        month_dir = os.path.join(ARCHIVE_DIR, table, month)
+        os.makedirs(month_dir, exist_ok=True)
+        name = f"{month_records[0].id}-{month_records[-1].id}.csv.gz"
+        path = os.path.join(month_dir, name + ".tmp")
+        with gzip.open(path, "wt", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(month_records[0]._fields)
+            writer.writerows(month_records)
+        pending.append(path)
+    return pending
+
+
+def publish_archive(pending):
+    for path in pending:
+        os.replace(path, path[:-len(".tmp")])
+
+
+def recover_archive(repo, table):
+    # Settle .tmp files left by an interrupted run: publish them if their
+    # DELETE committed, otherwise drop them (the rows get archived again)
+    for month in sorted(os.listdir(os.path.join(ARCHIVE_DIR, table))):
+        month_dir = os.path.join(ARCHIVE_DIR, table, month)
+        if not os.path.isdir(month_dir):
+            continue
+        for name in os.listdir(month_dir):
+            if not name.endswith(".tmp"):
+                continue
+            path = os.path.join(month_dir, name)
+            try:
+                with gzip.open(path, "rt", newline="") as f:
+                    ids = [int(row["id"]) for row in csv.DictReader(f)]
+            except (OSError, EOFError, ValueError, csv.Error):
+                ids = None  # Died while writing, so the DELETE never ran
+            if ids and not repo.existing_ids(ids):
+                publish_archive([path])
+            else:
+                os.remove(path)
+
+
+def archive_expired_rows(storage, table, cutoff):
+    repo = getattr(storage, table)
+    stats = {"rows_moved": 0, "batches": 0, "lock_seconds": 0.0, "max_lock_seconds": 0.0}
+
+    if os.path.isdir(os.path.join(ARCHIVE_DIR, table)):
+        recover_archive(repo, table)
+
+    while True:
+        # Read and archive outside the write lock; only the DELETE holds it
+        records = repo.list_before(cutoff, ARCHIVE_BATCH_SIZE)
+        if not records:
+            break
+
+        pending = write_archive(table, records)
+
+        locked_at = time.perf_counter()
+        repo.delete_many([record.id for record in records])
+        held = time.perf_counter() - locked_at
+        publish_archive(pending)
+
+        stats["rows_moved"] += len(records)
+        stats["batches"] += 1
+        stats["lock_seconds"] += held
+        stats["max_lock_seconds"] = max(stats["max_lock_seconds"], held)
+
+        # Give web workers a chance to grab the lock between batches
+        time.sleep(0.01)
+
+    return stats
+
+
+@app.cli.command("prune-db")
+@click.option("--full-vacuum", is_flag=True,
+              help="Also rewrite the whole database where the regular pass can't give "
+                   "space back. Locks the database; run it in a maintenance window.")
+def prune_db(full_vacuum):
+    """Archive expired auto_events/predictions and compact the database."""
+    storage = open_storage(DATABASE_URL)
+    if full_vacuum:
+        click.echo("Warning: a full vacuum rewrites the whole database and blocks "
+                   "all other writers until it finishes.", err=True)
+
+    for table, days in RETENTION_DAYS.items():
+        if days <= 0:
+            continue
+        cutoff = (datetime.today() - timedelta(days=days)).strftime("%Y-%m-%d")
+        stats = archive_expired_rows(storage, table, cutoff)
+        click.echo(f"{table}: moved {stats['rows_moved']} rows older than {cutoff} "
+                   f"in {stats['batches']} batches, locks held {stats['lock_seconds']:.3f}s "
+                   f"(max {stats['max_lock_seconds']:.3f}s)")
+
+    expired = storage.rate_limits.expire(RATE_BUCKET_TTL)
+    click.echo(f"rate_buckets: dropped {expired} buckets idle for over {RATE_BUCKET_TTL:.0f}s")
+
+    stats = storage.compact(full_vacuum)
+    storage.close()
+    click.echo(f"vacuum/analyze: reclaimed {stats['bytes_reclaimed']} bytes "
+               f"in {stats['seconds']:.3f}s")
+    if stats["pending_full"]:
+        click.echo("Freed space stays in the database until prune-db is run once with "
+                   "--full-vacuum.")
+
+
+def send_to_file(digests):
+    with open(REMINDER_OUTBOX, "a", encoding="utf-8") as f:
+        for to, subject, body in digests:
+            f.write(f"To: {to}\nSubject: {subject}\n\n{body}\n\n")
+
+def send_to_smtp(digests):
+    with smtplib.SMTP(SMTP_HOST, SMTP_PORT) as smtp:
+        for to, subject, body in digests:
+            msg = EmailMessage()
+            msg["From"] = REMINDER_SENDER
+            msg["To"] = to
+            msg["Subject"] = subject
+            msg.set_content(body)
+            smtp.send_message(msg)
+
+REMINDER_SINKS = {"file": send_to_file, "smtp": send_to_smtp}
+
+def render_digest(fullname, events, run_date):
+    lines = [f"Hi {fullname},", "", "Upcoming tasks on your crop calendar:"]
+    for e in events:
+        days = (datetime.strptime(e.date, "%Y-%m-%d").date() - run_date).days
+        when = {0: "today", 1: "tomorrow"}.get(days, f"on {e.date}")
+        crop = f" for {e.crop_name}" if e.crop_name else ""
+        lines.append(f"- {e.title} due {when}{crop}")
+    return "\n".join(lines)
+
+@app.cli.command("send-reminders")
+@click.option("--date", "run_date", default=None, help="Sweep as of this date (YYYY-MM-DD), default today.")
+@click.option("--days", default=1, show_default=True, help="How many days ahead to include.")
+@click.option("--sink", type=click.Choice(sorted(REMINDER_SINKS)), default="file", show_default=True)
+def send_reminders(run_date, days, sink):
+    """Send each user a digest of their upcoming custom and auto events."""
+    run_date = datetime.strptime(run_date, "%Y-%m-%d").date() if run_date else datetime.today().date()
+    window_start = (run_date + timedelta(days=1)).strftime("%Y-%m-%d")
+    window_end = (run_date + timedelta(days=days)).strftime("%Y-%m-%d")
+    deliver = REMINDER_SINKS[sink]
+
+    # Checkpoints go through their own session so committing them doesn't
+    # disturb the streaming read below
+    run_key = (run_date.isoformat(), days)
+    progress = open_storage(DATABASE_URL)
+    run = progress.reminders.start_run(*run_key)
+    if run.finished:
+        click.echo(f"Reminders for {run_date} (--days {days}) were already sent.")
+        progress.close()
+        return
+
+    # Both event tables streamed in user order and grouped by user as they go
+    sweep = open_storage(DATABASE_URL)
+    rows = sweep.reminders.iter_upcoming(window_start, window_end, run.last_user_id)
+
+    started = time.perf_counter()
+    sent = 0
+    batch = []
+
+    def flush(last_user_id):
+        deliver(batch)
+        progress.reminders.checkpoint(*run_key, last_user_id)
+        batch.clear()
+
+    subject = f"Crop tasks due {window_start}" if days == 1 else f"Crop tasks due {window_start} to {window_end}"
+    user_id = None
+    for user_id, events in itertools.groupby(rows, key=lambda r: r.user_id):
+        events = list(events)
+        batch.append((events[0].email, subject, render_digest(events[0].fullname, events, run_date)))
+        sent += 1
+        if len(batch) >= REMINDER_BATCH_SIZE:
+            flush(user_id)
+    if batch:
+        flush(user_id)
+    sweep.close()
+
+    progress.reminders.finish(*run_key)
+    progress.close()
+    click.echo(f"Sent {sent} digests for {window_start}..{window_end} in {time.perf_counter() - started:.2f}s")
+
 if __name__ == '__main__':
-    init_db()
     import os
     port = int(os.environ.get("PORT", 5000))
     app.run(host="0.0.0.0", port=port)
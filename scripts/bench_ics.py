@@ -0,0 +1,154 @@
+"""ICS feed benchmark: thousands of subscribed calendar clients polling.
+
+Seeds --clients users with --events auto events each, then has every client
+poll its feed for --rounds rounds, sending back the ETag it got last time
+the way calendar apps do. Before each round --change-rate of the users get
+a new event, so their next poll is a full 200 and everyone else's is a 304.
+Reports latency for both and the storage queries each poll made, and exits
+non-zero when a 304 reads more than the token and version or is too slow:
+
+    python scripts/bench_ics.py
+    python scripts/bench_ics.py --clients 5000 --database-url postgresql+standin:///bench.db
+"""
+import argparse
+import collections
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+REPOSITORIES = ("users", "predictions", "crops", "crops_info", "crop_tasks", "custom_events",
+                "auto_events", "calendar", "reminders", "rate_limits")
+# A 304 looks up the feed token and the user's events version, nothing else
+NOT_MODIFIED_QUERIES = 2
+
+
+class CountingRepository:
+    # Every repository call is one query; iter_events streams a single one
+    def __init__(self, repository, counter):
+        self._repository = repository
+        self._counter = counter
+
+    def __getattr__(self, name):
+        method = getattr(self._repository, name)
+        if name == "close":  # SQLite's rate_limits owns a connection; not a query
+            return method
+
+        def call(*args, **kwargs):
+            self._counter.queries += 1
+            return method(*args, **kwargs)
+        return call
+
+
+def counting(open_storage, counter):
+    def open_counted(url, **options):
+        storage = open_storage(url, **options)
+        for name in REPOSITORIES:
+            setattr(storage, name, CountingRepository(getattr(storage, name), counter))
+        return storage
+    return open_counted
+
+
+def seed(storage, clients, events):
+    tokens = []
+    for index in range(clients):
+        user_id = storage.users.add(f"Bench {index}", f"bench{index}@example.com", f"bench{index}", "x")
+        storage.auto_events.add_many(user_id, "Rice", [
+            (f"Task {n}", f"2026-{n % 12 + 1:02d}-{n % 28 + 1:02d}", "Bench event") for n in range(events)])
+        tokens.append((user_id, storage.calendar.feed_token(user_id)))
+    return tokens
+
+
+def percentile(values, fraction):
+    return sorted(values)[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", help="Default: a throwaway SQLite file.")
+    parser.add_argument("--clients", type=int, default=2000, help="Subscribed users, one feed each.")
+    parser.add_argument("--events", type=int, default=50, help="Events in each feed.")
+    parser.add_argument("--rounds", type=int, default=5, help="Polls per client.")
+    parser.add_argument("--change-rate", type=float, default=0.05,
+                        help="Fraction of users whose calendar changes before each round.")
+    parser.add_argument("--threads", type=int, default=1,
+                        help="Concurrent polls. They share this process's GIL, so latencies above "
+                             "1 include waiting for it; use it to look for lock contention.")
+    parser.add_argument("--not-modified-budget-ms", type=float, default=25, help="p99 budget for a 304.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        url = args.database_url or f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        # app reads DATABASE_URL and migrates at import
+        os.environ["DATABASE_URL"] = url
+        import app
+
+        with app.open_storage(url) as storage:
+            started = time.perf_counter()
+            tokens = seed(storage, args.clients, args.events)
+            print(f"seeded {args.clients} users x {args.events} events in {time.perf_counter() - started:.1f}s")
+
+            counter = threading.local()
+            app.open_storage = counting(app.open_storage, counter)
+            local = threading.local()
+            etags = [None] * len(tokens)
+
+            def poll(index):
+                if not hasattr(local, "client"):
+                    local.client = app.app.test_client()
+                counter.queries = 0
+                headers = {"If-None-Match": etags[index]} if etags[index] else {}
+                started = time.perf_counter()
+                response = local.client.get(f"/calendar/{tokens[index][1]}.ics", headers=headers)
+                response.get_data()
+                elapsed = (time.perf_counter() - started) * 1000
+                etags[index] = response.headers["ETag"]
+                return response.status_code, elapsed, counter.queries
+
+            results = []
+            rng = random.Random(0)
+            polling = 0
+            with ThreadPoolExecutor(args.threads) as pool:
+                for _ in range(args.rounds):
+                    for user_id, _ in rng.sample(tokens, int(len(tokens) * args.change_rate)):
+                        storage.custom_events.add(user_id, "Changed", "2026-06-01", None)
+                    started = time.perf_counter()
+                    results.extend(pool.map(poll, range(len(tokens))))
+                    polling += time.perf_counter() - started
+
+    by_status = collections.defaultdict(list)
+    for status, elapsed, queries in results:
+        by_status[status].append((elapsed, queries))
+    print(f"{len(results)} polls from {args.clients} clients on {args.threads} threads "
+          f"({len(results) / polling:.0f} polls/s)")
+    for status, polls in sorted(by_status.items()):
+        latencies = [elapsed for elapsed, _ in polls]
+        print(f"  {status}  {len(polls):7d}  p50 {statistics.median(latencies):6.2f} ms  "
+              f"p99 {percentile(latencies, 0.99):6.2f} ms  "
+              f"queries/poll {statistics.mean(queries for _, queries in polls):.2f}")
+
+    failures = []
+    not_modified = by_status.get(304, [])
+    if not not_modified:
+        failures.append("no poll was answered with 304")
+    elif max(queries for _, queries in not_modified) > NOT_MODIFIED_QUERIES:
+        failures.append(f"a 304 made more than {NOT_MODIFIED_QUERIES} queries")
+    elif percentile([elapsed for elapsed, _ in not_modified], 0.99) > args.not_modified_budget_ms:
+        failures.append(f"304 p99 is over the {args.not_modified_budget_ms:.0f} ms budget")
+    if set(by_status) - {200, 304}:
+        failures.append(f"unexpected statuses: {sorted(set(by_status) - {200, 304})}")
+
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,122 @@
+"""Reminder sweep benchmark: send-reminders over a million-user database.
+
+Seeds --users users, each with events spread over --history-days around the
+run date, then runs send-reminders in a fresh interpreter and reports its
+wall time and peak RSS. The sweep streams the window, so its memory must not
+grow with the number of users; the run fails when RSS grows by more than
+--rss-budget-mb during the sweep:
+
+    python scripts/bench_reminders.py
+    python scripts/bench_reminders.py --users 100000 --database-url postgresql+standin:///bench.db
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Rows per insert transaction while seeding
+SEED_BATCH = 20000
+
+SWEEP = """
+import json, resource, sys, time
+import app
+imported_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+started = time.perf_counter()
+result = app.app.test_cli_runner().invoke(args=["send-reminders", *sys.argv[1:]])
+seconds = time.perf_counter() - started
+if result.exit_code:
+    sys.exit(result.output)
+print(result.output.strip())
+print(json.dumps({
+    "seconds": seconds,
+    "imported_rss": imported_rss,
+    "peak_rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+}))
+"""
+
+
+def bulk_insert(storage, table, columns, rows):
+    # The repositories commit one user at a time, far too slow for millions
+    # of rows, so seed through the backend's connection in big batches
+    from storage.postgres import PostgresStorage
+    sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['?'] * len(columns))})"
+    if isinstance(storage, PostgresStorage):
+        with storage.conn.transaction():
+            storage.conn.cursor().executemany(sql.replace("?", "%s"), rows)
+    else:
+        with storage.conn:
+            storage.conn.executemany(sql, rows)
+
+
+def seed(storage, users, events, custom_events, run_date, history_days):
+    # Explicit ids so events can reference users without a round trip
+    rng = random.Random(0)
+    first_day = run_date - timedelta(days=history_days // 2)
+    days = [(first_day + timedelta(days=n)).isoformat() for n in range(history_days)]
+    per_batch = max(SEED_BATCH // (1 + events + custom_events), 1)
+    for start in range(1, users + 1, per_batch):
+        ids = range(start, min(start + per_batch, users + 1))
+        bulk_insert(storage, "users", ("id", "fullname", "email", "username", "password"),
+                    [(i, f"Bench {i}", f"bench{i}@example.com", f"bench{i}", "x") for i in ids])
+        bulk_insert(storage, "auto_events", ("user_id", "title", "date", "notes", "crop_name"),
+                    [(i, "Irrigation", rng.choice(days), None, "Rice") for i in ids for _ in range(events)])
+        bulk_insert(storage, "custom_events", ("user_id", "title", "date", "notes"),
+                    [(i, "Market day", rng.choice(days), None) for i in ids for _ in range(custom_events)])
+
+
+def megabytes(maxrss):
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", help="Default: a throwaway SQLite file.")
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--events", type=int, default=10, help="Auto events per user.")
+    parser.add_argument("--custom-events", type=int, default=2, help="Custom events per user.")
+    parser.add_argument("--history-days", type=int, default=730, help="Days the events are spread over.")
+    parser.add_argument("--days", type=int, default=3, help="send-reminders --days.")
+    parser.add_argument("--rss-budget-mb", type=float, default=100,
+                        help="Most the sweep may grow RSS beyond what importing app took.")
+    args = parser.parse_args()
+
+    from storage import open_storage
+
+    run_date = date.today()
+    with tempfile.TemporaryDirectory() as tmp:
+        url = args.database_url or f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        with open_storage(url) as storage:
+            storage.migrate()
+            started = time.perf_counter()
+            seed(storage, args.users, args.events, args.custom_events, run_date, args.history_days)
+        rows = args.users * (args.events + args.custom_events)
+        print(f"seeded {args.users} users, {rows} events in {time.perf_counter() - started:.1f}s")
+
+        env = dict(os.environ, DATABASE_URL=url, REMINDER_OUTBOX=os.path.join(tmp, "outbox.txt"))
+        result = subprocess.run(
+            [sys.executable, "-c", SWEEP, "--date", run_date.isoformat(), "--days", str(args.days)],
+            cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+        output, stats = result.stdout.strip().rsplit("\n", 1)
+        stats = json.loads(stats)
+
+    growth = megabytes(stats["peak_rss"] - stats["imported_rss"])
+    print(output)
+    print(f"sweep wall time {stats['seconds']:.2f}s, peak RSS {megabytes(stats['peak_rss']):.1f} MB "
+          f"({growth:+.1f} MB over importing app; budget {args.rss_budget_mb:.0f} MB)")
+    if growth > args.rss_budget_mb:
+        print(f"FAIL: the sweep grew RSS by {growth:.1f} MB; it is buffering the window", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,124 @@
+"""SowingIndex benchmark: build and query time at 1k-10k sowing windows.
+
+Builds the index from random crops_info rows (a share with cross-year or no
+windows, like the real table) at each --sizes, then times point queries
+(crops_on, as /api/sowable?date=) and range queries (crops_between, as
+?end=) on random days. Every query is checked against a linear scan, and
+the run fails when a size misses a budget:
+
+    python scripts/bench_sowing_index.py
+    python scripts/bench_sowing_index.py --sizes 1000 10000 --queries 5000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Share of rows without a window (sowable any day) and wrapping past Dec 31
+NO_WINDOW_RATE = 0.05
+CROSS_YEAR_RATE = 0.2
+MAX_RANGE_DAYS = 60
+
+
+def random_crops(count, rng):
+    from storage import CropInfo
+
+    def month_day(day):
+        return time.strftime("%m-%d", time.strptime(f"2000 {day}", "%Y %j"))
+
+    crops = []
+    for crop_id in range(1, count + 1):
+        if rng.random() < NO_WINDOW_RATE:
+            crops.append(CropInfo(crop_id, f"crop{crop_id}", None, None))
+            continue
+        start = rng.randint(1, 366)
+        length = rng.randint(7, 120)
+        end = start + length if rng.random() < CROSS_YEAR_RATE else min(start + length, 366)
+        crops.append(CropInfo(crop_id, f"crop{crop_id}", month_day(start), month_day((end - 1) % 366 + 1)))
+    return crops
+
+
+def scan(crops, first_day, last_day, day_of_year):
+    # Reference answer: every crop whose window overlaps first_day..last_day
+    days = set(range(first_day, last_day + 1)) if first_day <= last_day else \
+        set(range(first_day, 367)) | set(range(1, last_day + 1))
+    found = set()
+    for crop in crops:
+        if not (crop.sowing_start and crop.sowing_end):
+            found.add(crop.id)
+            continue
+        start, end = day_of_year(crop.sowing_start), day_of_year(crop.sowing_end)
+        window = range(start, end + 1) if start <= end else [*range(start, 367), *range(1, end + 1)]
+        if days.intersection(window):
+            found.add(crop.id)
+    return found
+
+
+def timed(function, *args):
+    started = time.perf_counter()
+    result = function(*args)
+    return result, (time.perf_counter() - started) * 1000
+
+
+def percentile(values, fraction):
+    return sorted(values)[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 2000, 5000, 10000])
+    parser.add_argument("--queries", type=int, default=2000, help="Point and range queries per size.")
+    parser.add_argument("--checked", type=int, default=50, help="Queries per size checked against a scan.")
+    parser.add_argument("--build-budget-ms", type=float, default=1000, help="At the largest size.")
+    parser.add_argument("--query-budget-ms", type=float, default=5, help="p99 for a point or range query.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # app migrates DATABASE_URL at import; the index itself needs no database
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        from app import SowingIndex, day_of_year
+
+    rng = random.Random(0)
+    failures = []
+    print(f"{'windows':>8} {'build ms':>9} {'point p50/p99 ms':>17} {'range p50/p99 ms':>17} {'crops/day':>9}")
+    for size in args.sizes:
+        crops = random_crops(size, rng)
+        index, build_ms = min((timed(SowingIndex, crops) for _ in range(3)), key=lambda result: result[1])
+
+        point_ms, range_ms, found = [], [], []
+        for n in range(args.queries):
+            day = rng.randint(1, 366)
+            last_day = (day + rng.randint(0, MAX_RANGE_DAYS) - 1) % 366 + 1
+            crop_ids, elapsed = timed(index.crops_on, day)
+            point_ms.append(elapsed)
+            found.append(len(crop_ids))
+            range_ids, elapsed = timed(index.crops_between, day, last_day)
+            range_ms.append(elapsed)
+            if n < args.checked:
+                if crop_ids != scan(crops, day, day, day_of_year):
+                    failures.append(f"{size} windows: crops_on({day}) disagrees with a scan")
+                if range_ids != scan(crops, day, last_day, day_of_year):
+                    failures.append(f"{size} windows: crops_between({day}, {last_day}) disagrees with a scan")
+
+        print(f"{size:>8} {build_ms:>9.1f} {statistics.median(point_ms):>8.4f}/{percentile(point_ms, 0.99):<8.4f} "
+              f"{statistics.median(range_ms):>8.4f}/{percentile(range_ms, 0.99):<8.4f} "
+              f"{statistics.mean(found):>9.0f}")
+        for name, latencies in (("point", point_ms), ("range", range_ms)):
+            if percentile(latencies, 0.99) > args.query_budget_ms:
+                failures.append(f"{size} windows: {name} query p99 is over {args.query_budget_ms:.0f} ms")
+        if size == max(args.sizes) and build_ms > args.build_budget_ms:
+            failures.append(f"{size} windows: build took {build_ms:.0f} ms, over {args.build_budget_ms:.0f} ms")
+
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+"""Startup benchmark: import time of app.py and first-request latency.
+
+Runs each measurement in a fresh interpreter against a throwaway database
+and exits non-zero when a budget is exceeded, so it can gate deploys:
+
+    python scripts/bench_startup.py
+    python scripts/bench_startup.py --runs 10 --import-budget-ms 600
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that must stay out of `import app`; they load on the first /predict
+LAZY_MODULES = ("pandas", "sklearn", "joblib")
+
+FIRST_REQUESTS = """
+import json, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+client = app.app.test_client()
+client.get("/login")
+first_request = time.perf_counter()
+model = app.get_model()
+model.predict([[90, 42, 43, 20.8, 82.0, 6.5, 202.9]])
+first_predict = time.perf_counter()
+print(json.dumps({
+    "import_ms": (imported - started) * 1000,
+    "first_request_ms": (first_request - imported) * 1000,
+    "first_predict_ms": (first_predict - first_request) * 1000,
+}))
+"""
+
+
+def run_python(args, env):
+    return subprocess.run([sys.executable, *args], cwd=ROOT, env=env,
+                          capture_output=True, text=True, check=True)
+
+
+def import_profile(env):
+    # -X importtime writes "import time: self [us] | cumulative [us] | name" to
+    # stderr, children before their parent and nested two spaces per level.
+    # Returns the cumulative ms of app and of every module app pulled in.
+    result = run_python(["-X", "importtime", "-c", "import app"], env)
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, total, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        entries.append((depth, name.strip(), int(total) / 1000))
+
+    # app is the last top-level entry; its subtree is everything nested
+    # below it since the previous top-level entry (interpreter startup)
+    end = max(i for i, (depth, name, _) in enumerate(entries) if depth == 0 and name == "app")
+    start = max((i for i, (depth, _, _) in enumerate(entries[:end]) if depth == 0), default=-1) + 1
+    return entries[end][2], [(name, ms, depth) for depth, name, ms in entries[start:end]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="Median over this many fresh interpreters.")
+    parser.add_argument("--import-budget-ms", type=float, default=800)
+    parser.add_argument("--first-request-budget-ms", type=float, default=250)
+    parser.add_argument("--first-predict-budget-ms", type=float, default=5000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+
+        total, imported = import_profile(env)
+        eager = {name.split(".")[0] for name, _, _ in imported} & set(LAZY_MODULES)
+        print(f"import app (-X importtime): {total:.1f} ms cumulative")
+        direct = sorted((item for item in imported if item[2] == 1), key=lambda item: item[1], reverse=True)
+        for name, ms, _ in direct[:5]:
+            print(f"  {name:<24} {ms:8.1f} ms")
+
+        samples = [json.loads(run_python(["-c", FIRST_REQUESTS], env).stdout.splitlines()[-1])
+                   for _ in range(args.runs)]
+
+    failures = []
+    if eager:
+        failures.append(f"imported eagerly by app: {', '.join(sorted(eager))}")
+    for key, budget in (("import_ms", args.import_budget_ms),
+                        ("first_request_ms", args.first_request_budget_ms),
+                        ("first_predict_ms", args.first_predict_budget_ms)):
+        median = statistics.median(sample[key] for sample in samples)
+        print(f"{key:<18} median {median:8.1f} ms  (budget {budget:.0f} ms)")
+        if median > budget:
+            failures.append(f"{key} {median:.1f} ms is over the {budget:.0f} ms budget")
+
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
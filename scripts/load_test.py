@@ -0,0 +1,110 @@
+"""Load test for admission control on /predict and /weather.
+
+Point it at a running server (gunicorn or `flask run`). It signs up
+throwaway accounts, then has every account hammer one endpoint from its own
+thread for --duration seconds. Overload has to be shed (429/503 with
+Retry-After, answered quickly), never queued, so the run fails if a shed
+response is missing Retry-After or takes longer than --shed-budget-ms:
+
+    python scripts/load_test.py --base-url http://127.0.0.1:8000 --users 20 --duration 30
+"""
+import argparse
+import collections
+import statistics
+import sys
+import threading
+import time
+
+import requests
+
+FORMS = {
+    "predict": {"N": 90, "P": 42, "K": 43, "ph": 6.5, "location": "Delhi"},
+    "weather": {"city": "Delhi"},
+}
+
+
+def login(base_url, index, password):
+    session = requests.Session()
+    email = f"loadtest{index}@example.com"
+    # Already registered on reruns; signup just redirects back then
+    session.post(f"{base_url}/signup", allow_redirects=False, data={
+        "fullname": f"Load Test {index}", "email": email, "username": f"loadtest{index}",
+        "password": password, "confirm_password": password,
+    })
+    session.post(f"{base_url}/login", data={"email": email, "password": password}, allow_redirects=False)
+    if "session" not in session.cookies:
+        raise SystemExit(f"Could not log in as {email}")
+    return session
+
+
+def hammer(session, url, form, deadline, results, lock):
+    while time.monotonic() < deadline:
+        started = time.perf_counter()
+        try:
+            response = session.post(url, data=form, allow_redirects=False, timeout=60)
+            outcome = (response.status_code, "Retry-After" in response.headers)
+        except requests.RequestException as e:
+            outcome = (type(e).__name__, False)
+        elapsed = (time.perf_counter() - started) * 1000
+        with lock:
+            results.append((outcome[0], outcome[1], elapsed))
+
+
+def percentile(values, fraction):
+    return sorted(values)[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--base-url", default="http://127.0.0.1:5000")
+    parser.add_argument("--endpoint", choices=sorted(FORMS), default="predict")
+    parser.add_argument("--users", type=int, default=10, help="Accounts, one client thread each.")
+    parser.add_argument("--duration", type=float, default=20, help="Seconds to keep sending.")
+    parser.add_argument("--password", default="load-test")
+    parser.add_argument("--shed-budget-ms", type=float, default=500,
+                        help="Slowest acceptable 429/503; slower means requests queued.")
+    args = parser.parse_args()
+
+    base_url = args.base_url.rstrip("/")
+    sessions = [login(base_url, index, args.password) for index in range(args.users)]
+
+    results, lock = [], threading.Lock()
+    deadline = time.monotonic() + args.duration
+    threads = [threading.Thread(target=hammer, args=(session, f"{base_url}/{args.endpoint}",
+                                                       FORMS[args.endpoint], deadline, results, lock))
+               for session in sessions]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    by_status = collections.defaultdict(list)
+    for status, _, elapsed in results:
+        by_status[status].append(elapsed)
+
+    print(f"{len(results)} requests to /{args.endpoint} from {args.users} users "
+          f"in {args.duration:.0f}s ({len(results) / args.duration:.1f}/s)")
+    for status, latencies in sorted(by_status.items(), key=lambda item: str(item[0])):
+        print(f"  {status!s:<16} {len(latencies):6d}  p50 {statistics.median(latencies):7.1f} ms  "
+              f"p99 {percentile(latencies, 0.99):7.1f} ms  max {max(latencies):7.1f} ms")
+
+    failures = []
+    shed = [(has_retry_after, elapsed) for status, has_retry_after, elapsed in results if status in (429, 503)]
+    if any(not has_retry_after for has_retry_after, _ in shed):
+        failures.append("some 429/503 responses had no Retry-After header")
+    slowest_shed = max((elapsed for _, elapsed in shed), default=0)
+    if slowest_shed > args.shed_budget_ms:
+        failures.append(f"slowest 429/503 took {slowest_shed:.1f} ms, over the "
+                        f"{args.shed_budget_ms:.0f} ms budget; requests are queueing")
+    errors = sum(len(latencies) for status, latencies in by_status.items()
+                 if not isinstance(status, int) or status >= 500 and status != 503)
+    if errors:
+        failures.append(f"{errors} requests failed outright (5xx other than 503, or no response)")
+
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
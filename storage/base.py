@@ -0,0 +1,352 @@
+"""Records, errors and the repository interfaces every backend implements.
+
+Routes only ever see these types: rows come back as the NamedTuples below
+(so templates can use crop.name, crop['name'] or crop[1]) and backend
+errors are translated into the exceptions defined here.
+"""
+from abc import ABC, abstractmethod
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Set
+
+
+# ----------------- Records -----------------
+class User(NamedTuple):
+    id: int
+    fullname: str
+    email: str
+    username: str
+    password: str
+    role: str
+
+
+class Prediction(NamedTuple):
+    id: int
+    user_id: int
+    crop: str
+    nitrogen: float
+    phosphorus: float
+    potassium: float
+    temperature: float
+    humidity: float
+    ph: float
+    rainfall: float
+    created_at: str
+
+
+class Crop(NamedTuple):
+    id: int
+    name: str
+    scientific_name: Optional[str]
+    category: Optional[str]
+    best_season: Optional[str]
+    optimal_growing_conditions: Optional[str]
+    growth_duration: Optional[str]
+    growing_stages: Optional[str]
+    pest_requirements: Optional[str]
+    water_required: Optional[str]
+    description: Optional[str]
+    image_url: Optional[str]
+
+
+# Columns of Crop that callers may set
+CROP_FIELDS = Crop._fields[1:]
+
+
+class CropInfo(NamedTuple):
+    id: int
+    name: str
+    sowing_start: Optional[str]
+    sowing_end: Optional[str]
+
+
+class CropTask(NamedTuple):
+    id: int
+    crop_id: int
+    task_type: str
+    day_offset: int
+    notes: Optional[str]
+
+
+class CustomEvent(NamedTuple):
+    id: int
+    user_id: int
+    title: str
+    date: str
+    notes: Optional[str]
+
+
+class AutoEvent(NamedTuple):
+    id: int
+    user_id: int
+    title: str
+    date: str
+    notes: Optional[str]
+    crop_name: Optional[str]
+
+
+class CalendarEntry(NamedTuple):
+    kind: str  # "custom" or "auto"
+    id: int
+    title: str
+    date: str
+    notes: Optional[str]
+
+
+class ReminderRun(NamedTuple):
+    last_user_id: int
+    finished: bool
+
+
+class ReminderRow(NamedTuple):
+    user_id: int
+    email: str
+    fullname: str
+    title: str
+    date: str
+    crop_name: Optional[str]
+
+
+class RateBucket(NamedTuple):
+    key: str
+    tokens: float
+    updated_at: float
+
+
+# ----------------- Errors -----------------
+class StorageError(Exception):
+    """Base class for errors raised by a storage backend."""
+
+
+class DuplicateError(StorageError):
+    """A unique column (e.g. users.email) already holds this value."""
+
+
+class StorageBusy(StorageError):
+    """The backend couldn't take a lock or connection in time; the caller may retry later."""
+
+
+# ----------------- Repositories -----------------
+class UserRepository(ABC):
+    @abstractmethod
+    def get_by_email(self, email: str) -> Optional[User]: ...
+
+    @abstractmethod
+    def add(self, fullname: str, email: str, username: str, password: str, role: str = "user") -> int:
+        """Insert a user; raises DuplicateError if the email or username is taken."""
+
+    @abstractmethod
+    def list_all(self) -> List[User]: ...
+
+    @abstractmethod
+    def set_role(self, user_id: int, role: str) -> None: ...
+
+
+class PredictionRepository(ABC):
+    @abstractmethod
+    def add(self, user_id: int, crop: str, nitrogen: float, phosphorus: float, potassium: float,
+            temperature: float, humidity: float, ph: float, rainfall: float) -> int: ...
+
+    @abstractmethod
+    def list_before(self, cutoff: str, limit: int) -> List[Prediction]:
+        """Oldest predictions created before cutoff (YYYY-MM-DD)."""
+
+    @abstractmethod
+    def existing_ids(self, ids: List[int]) -> Set[int]:
+        """The subset of ids still stored, for recovering an interrupted archive run."""
+
+    @abstractmethod
+    def delete_many(self, ids: List[int]) -> None: ...
+
+
+class CropRepository(ABC):
+    @abstractmethod
+    def list_all(self) -> List[Crop]: ...
+
+    @abstractmethod
+    def get(self, crop_id: int) -> Optional[Crop]: ...
+
+    @abstractmethod
+    def add(self, **fields) -> int:
+        """Insert a crop; keyword arguments are taken from CROP_FIELDS."""
+
+    @abstractmethod
+    def update(self, crop_id: int, **fields) -> None: ...
+
+    @abstractmethod
+    def delete(self, crop_id: int) -> None: ...
+
+
+class CropInfoRepository(ABC):
+    @abstractmethod
+    def list_all(self) -> List[CropInfo]: ...
+
+    @abstractmethod
+    def get(self, crop_id: int) -> Optional[CropInfo]: ...
+
+    @abstractmethod
+    def get_by_name(self, name: str) -> Optional[CropInfo]: ...
+
+    @abstractmethod
+    def add(self, name: str, sowing_start: str, sowing_end: str) -> int: ...
+
+    @abstractmethod
+    def update(self, crop_id: int, name: str, sowing_start: str, sowing_end: str) -> None: ...
+
+    @abstractmethod
+    def delete(self, crop_id: int) -> None:
+        """Delete a crop together with its crop_tasks."""
+
+    @abstractmethod
+    def version(self) -> int:
+        """Counter bumped by every add/update/delete, for in-memory caches."""
+
+
+class CropTaskRepository(ABC):
+    @abstractmethod
+    def list_for_crop(self, crop_id: int) -> List[CropTask]: ...
+
+    @abstractmethod
+    def add(self, crop_id: int, task_type: str, day_offset: int, notes: str) -> int: ...
+
+    @abstractmethod
+    def delete(self, task_id: int) -> Optional[int]:
+        """Delete a task and return its crop_id, or None if it didn't exist."""
+
+
+class CustomEventRepository(ABC):
+    @abstractmethod
+    def list_for_user(self, user_id: int) -> List[CustomEvent]: ...
+
+    @abstractmethod
+    def list_on_date(self, date: str) -> List[CustomEvent]: ...
+
+    @abstractmethod
+    def add(self, user_id: int, title: str, date: str, notes: str) -> int:
+        """Insert an event and bump the owner's calendar version."""
+
+    @abstractmethod
+    def delete(self, event_id: int) -> None:
+        """Delete an event and bump the owner's calendar version."""
+
+
+class AutoEventRepository(ABC):
+    @abstractmethod
+    def list_for_user(self, user_id: int) -> List[AutoEvent]: ...
+
+    @abstractmethod
+    def list_on_date(self, date: str) -> List[AutoEvent]: ...
+
+    @abstractmethod
+    def add_many(self, user_id: int, crop_name: str, events: Iterable[tuple]) -> None:
+        """Insert (title, date, notes) events and bump the calendar version once."""
+
+    @abstractmethod
+    def delete(self, event_id: int) -> None: ...
+
+    @abstractmethod
+    def list_before(self, cutoff: str, limit: int) -> List[AutoEvent]:
+        """Oldest events dated before cutoff (YYYY-MM-DD)."""
+
+    @abstractmethod
+    def existing_ids(self, ids: List[int]) -> Set[int]:
+        """The subset of ids still stored, for recovering an interrupted archive run."""
+
+    @abstractmethod
+    def delete_many(self, ids: List[int]) -> None:
+        """Delete events and bump the calendar version of every owner."""
+
+
+class CalendarRepository(ABC):
+    @abstractmethod
+    def version(self, user_id: int) -> int:
+        """Counter bumped whenever the user's custom or auto events change."""
+
+    @abstractmethod
+    def iter_events(self, user_id: int) -> Iterator[CalendarEntry]:
+        """Stream the user's custom and auto events."""
+
+    @abstractmethod
+    def feed_token(self, user_id: int) -> str:
+        """The user's secret feed token, created on first use."""
+
+    @abstractmethod
+    def rotate_feed_token(self, user_id: int) -> str:
+        """Replace the user's feed token, revoking links that used the old one."""
+
+    @abstractmethod
+    def user_for_feed_token(self, token: str) -> Optional[int]: ...
+
+
+class ReminderRepository(ABC):
+    """Resume checkpoints are kept per sweep window: run_date plus days ahead."""
+
+    @abstractmethod
+    def start_run(self, run_date: str, days: int) -> ReminderRun:
+        """Create the checkpoint for this window if needed and return it."""
+
+    @abstractmethod
+    def checkpoint(self, run_date: str, days: int, last_user_id: int) -> None: ...
+
+    @abstractmethod
+    def finish(self, run_date: str, days: int) -> None: ...
+
+    @abstractmethod
+    def iter_upcoming(self, start: str, end: str, after_user_id: int) -> Iterator[ReminderRow]:
+        """Events dated start..end for users after after_user_id, ordered by user and date."""
+
+
+class RateLimitRepository(ABC):
+    @abstractmethod
+    def take(self, key: str, per_minute: float, burst: float, cost: float = 1) -> float:
+        """Take cost tokens from a bucket; return seconds to wait, or 0 if taken.
+
+        Raises StorageBusy rather than waiting long for a lock.
+        """
+
+    @abstractmethod
+    def refund(self, key: str, burst: float, cost: float = 1) -> None:
+        """Give back tokens taken for a request that was shed further on."""
+
+    @abstractmethod
+    def expire(self, idle_seconds: float) -> int:
+        """Drop buckets untouched for idle_seconds; return how many went."""
+
+    @abstractmethod
+    def list_buckets(self, prefix: str) -> List[RateBucket]: ...
+
+
+class Storage(ABC):
+    """One backend session: a set of repositories sharing a connection."""
+
+    users: UserRepository
+    predictions: PredictionRepository
+    crops: CropRepository
+    crops_info: CropInfoRepository
+    crop_tasks: CropTaskRepository
+    custom_events: CustomEventRepository
+    auto_events: AutoEventRepository
+    calendar: CalendarRepository
+    reminders: ReminderRepository
+    rate_limits: RateLimitRepository
+
+    @abstractmethod
+    def migrate(self) -> None:
+        """Bring the schema up to the latest version."""
+
+    @abstractmethod
+    def compact(self, full: bool = False) -> dict:
+        """Reclaim free space and refresh planner statistics.
+
+        full allows a rewrite of the whole database where the cheap pass
+        can't give space back; it blocks every other writer while it runs.
+        Returns bytes_reclaimed, seconds taken, and pending_full: whether
+        space will only come back after a full run.
+        """
+
+    @abstractmethod
+    def close(self) -> None: ...
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
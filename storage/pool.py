@@ -0,0 +1,53 @@
+"""A small thread-safe connection pool for server database backends."""
+import queue
+import threading
+
+from storage.base import StorageBusy
+
+
+class ConnectionPool:
+    """Up to size connections shared by every thread of a worker process.
+
+    Connections are opened on demand and reused most-recently-returned first,
+    so a quiet worker keeps only the connections it actually needs warm.
+    acquire() waits at most timeout seconds for one to come back and then
+    raises StorageBusy, so an exhausted pool sheds load instead of queueing.
+    """
+
+    def __init__(self, connect, size=10, timeout=5.0):
+        self.connect = connect
+        self.size = size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def acquire(self):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise StorageBusy(f"No database connection free after {self.timeout}s")
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            return self.connect()
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def release(self, conn, discard=False):
+        # Discard connections left mid-query or broken, rather than hand
+        # them to the next request
+        try:
+            if discard or getattr(conn, "closed", False):
+                conn.close()
+            else:
+                self._idle.put(conn)
+        finally:
+            self._slots.release()
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
@@ -0,0 +1,622 @@
+"""PostgreSQL backend: the repositories from storage.base over pooled connections.
+
+Each worker process keeps one ConnectionPool per database URL; a
+PostgresStorage session borrows a connection on first use and hands it back
+on close(), so a request costs no connect round trip. Connections run in
+autocommit mode and every write goes through conn.transaction().
+
+psycopg is only imported for postgresql:// URLs. postgresql+standin:///path
+runs the same code against storage.standin instead, for local development
+and the test suite.
+"""
+import secrets
+import threading
+import time
+from datetime import datetime, timezone
+
+from storage.base import (
+    AutoEvent, AutoEventRepository, CalendarEntry, CalendarRepository, Crop, CROP_FIELDS,
+    CropInfo, CropInfoRepository, CropRepository, CropTask, CropTaskRepository, CustomEvent,
+    CustomEventRepository, DuplicateError, Prediction, PredictionRepository, RateBucket,
+    RateLimitRepository, ReminderRepository, ReminderRow, ReminderRun, Storage, StorageBusy, User,
+    UserRepository,
+)
+from storage.pool import ConnectionPool
+
+# Connections per worker process: one per Procfile thread plus headroom for
+# the CLI commands, which hold two sessions at once
+POOL_SIZE = 10
+# Longest a request waits for a pooled connection before it's shed
+POOL_TIMEOUT = 5.0
+# Admission checks give up on a locked bucket row after this long
+LIMITER_LOCK_TIMEOUT_MS = 100
+# Key for the advisory lock that makes booting workers migrate one at a time
+MIGRATION_LOCK = 0x63726F70
+
+# Schema migrations, applied in order. schema_version records how many have
+# run; append new steps, never edit released ones.
+MIGRATIONS = [
+    # 1: the schema as of SQLite migration 7
+    [
+        """
+        CREATE TABLE users (
+            id BIGSERIAL PRIMARY KEY,
+            fullname TEXT NOT NULL,
+            email TEXT UNIQUE NOT NULL,
+            username TEXT UNIQUE NOT NULL,
+            password TEXT NOT NULL,
+            role TEXT NOT NULL DEFAULT 'user'
+        )
+        """,
+        """
+        CREATE TABLE predictions (
+            id BIGSERIAL PRIMARY KEY,
+            user_id BIGINT REFERENCES users(id),
+            crop TEXT,
+            nitrogen DOUBLE PRECISION,
+            phosphorus DOUBLE PRECISION,
+            potassium DOUBLE PRECISION,
+            temperature DOUBLE PRECISION,
+            humidity DOUBLE PRECISION,
+            ph DOUBLE PRECISION,
+            rainfall DOUBLE PRECISION,
+            created_at TEXT NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE crops (
+            id BIGSERIAL PRIMARY KEY,
+            name TEXT NOT NULL,
+            scientific_name TEXT,
+            category TEXT,
+            best_season TEXT,
+            optimal_growing_conditions TEXT,
+            growth_duration TEXT,
+            growing_stages TEXT,
+            pest_requirements TEXT,
+            water_required TEXT,
+            description TEXT,
+            image_url TEXT
+        )
+        """,
+        """
+        CREATE TABLE crops_info (
+            id BIGSERIAL PRIMARY KEY,
+            name TEXT NOT NULL,
+            sowing_start TEXT,
+            sowing_end TEXT
+        )
+        """,
+        """
+        CREATE TABLE crop_tasks (
+            id BIGSERIAL PRIMARY KEY,
+            crop_id BIGINT NOT NULL REFERENCES crops_info(id),
+            task_type TEXT NOT NULL,
+            day_offset INTEGER NOT NULL,
+            notes TEXT
+        )
+        """,
+        """
+        CREATE TABLE custom_events (
+            id BIGSERIAL PRIMARY KEY,
+            user_id BIGINT REFERENCES users(id),
+            title TEXT NOT NULL,
+            date TEXT NOT NULL,
+            notes TEXT
+        )
+        """,
+        """
+        CREATE TABLE auto_events (
+            id BIGSERIAL PRIMARY KEY,
+            user_id BIGINT REFERENCES users(id),
+            title TEXT NOT NULL,
+            date TEXT NOT NULL,
+            notes TEXT,
+            crop_name TEXT
+        )
+        """,
+        """
+        CREATE TABLE event_versions (
+            user_id BIGINT PRIMARY KEY REFERENCES users(id),
+            version BIGINT NOT NULL DEFAULT 0
+        )
+        """,
+        """
+        CREATE TABLE table_versions (
+            name TEXT PRIMARY KEY,
+            version BIGINT NOT NULL DEFAULT 0
+        )
+        """,
+        """
+        CREATE TABLE reminder_runs (
+            run_date TEXT NOT NULL,
+            days INTEGER NOT NULL,
+            last_user_id BIGINT NOT NULL DEFAULT 0,
+            finished BOOLEAN NOT NULL DEFAULT FALSE,
+            PRIMARY KEY (run_date, days)
+        )
+        """,
+        """
+        CREATE TABLE rate_buckets (
+            key TEXT PRIMARY KEY,
+            tokens DOUBLE PRECISION NOT NULL,
+            updated_at DOUBLE PRECISION NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE feed_tokens (
+            user_id BIGINT PRIMARY KEY REFERENCES users(id),
+            token TEXT UNIQUE NOT NULL
+        )
+        """,
+        "CREATE INDEX idx_predictions_created_at ON predictions(created_at)",
+        "CREATE INDEX idx_custom_events_user_date ON custom_events(user_id, date)",
+        "CREATE INDEX idx_auto_events_user_date ON auto_events(user_id, date)",
+        "CREATE INDEX idx_custom_events_date_user ON custom_events(date, user_id)",
+        "CREATE INDEX idx_auto_events_date_user ON auto_events(date, user_id)",
+    ],
+]
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def load_driver(url):
+    # The DB-API module (for its exception classes) and a connect function
+    scheme, _, location = url.partition("://")
+    if scheme == "postgresql+standin":
+        from storage import standin
+        # postgresql+standin:///relative.db or postgresql+standin:////absolute/path.db
+        return standin, lambda: standin.connect(location[1:])
+    import psycopg
+    return psycopg, lambda: psycopg.connect(url, autocommit=True)
+
+
+def shared_pool(url, pool_size=POOL_SIZE, pool_timeout=POOL_TIMEOUT):
+    # One pool per worker process and URL, shared by all its threads
+    with _pools_lock:
+        if url not in _pools:
+            driver, connect = load_driver(url)
+            _pools[url] = (driver, ConnectionPool(connect, pool_size, pool_timeout))
+        return _pools[url]
+
+
+def columns(record):
+    return ", ".join(record._fields)
+
+
+def placeholders(values):
+    return ",".join(["%s"] * len(values))
+
+
+def bump_events_version(conn, user_id):
+    conn.execute("""
+        INSERT INTO event_versions (user_id, version) VALUES (%s, 1)
+        ON CONFLICT (user_id) DO UPDATE SET version = event_versions.version + 1
+    """, (user_id,))
+
+
+def bump_table_version(conn, name):
+    conn.execute("""
+        INSERT INTO table_versions (name, version) VALUES (%s, 1)
+        ON CONFLICT (name) DO UPDATE SET version = table_versions.version + 1
+    """, (name,))
+
+
+class PostgresRepository:
+    def __init__(self, session):
+        self.session = session
+
+    @property
+    def conn(self):
+        return self.session.conn
+
+    @property
+    def driver(self):
+        return self.session.driver
+
+    def stream(self, sql, params):
+        # Rows arrive as they're read instead of all at once. A stream left
+        # unfinished still owns the connection, so the pool must drop it.
+        cursor = self.conn.cursor()
+        finished = False
+        try:
+            yield from cursor.stream(sql, params)
+            finished = True
+        finally:
+            if not finished:
+                self.session.discard = True
+            cursor.close()
+
+
+class PostgresUsers(PostgresRepository, UserRepository):
+    def get_by_email(self, email):
+        row = self.conn.execute(f"SELECT {columns(User)} FROM users WHERE email=%s", (email,)).fetchone()
+        return User._make(row) if row else None
+
+    def add(self, fullname, email, username, password, role="user"):
+        try:
+            with self.conn.transaction():
+                row = self.conn.execute("""
+                    INSERT INTO users (fullname, email, username, password, role)
+                    VALUES (%s, %s, %s, %s, %s) RETURNING id
+                """, (fullname, email, username, password, role)).fetchone()
+        except self.driver.IntegrityError as e:
+            raise DuplicateError(str(e)) from e
+        return row[0]
+
+    def list_all(self):
+        return [User._make(row) for row in self.conn.execute(f"SELECT {columns(User)} FROM users ORDER BY id")]
+
+    def set_role(self, user_id, role):
+        with self.conn.transaction():
+            self.conn.execute("UPDATE users SET role = %s WHERE id = %s", (role, user_id))
+
+
+class PostgresPredictions(PostgresRepository, PredictionRepository):
+    def add(self, user_id, crop, nitrogen, phosphorus, potassium, temperature, humidity, ph, rainfall):
+        # Same text format as SQLite's CURRENT_TIMESTAMP, which list_before compares against
+        created_at = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+        with self.conn.transaction():
+            row = self.conn.execute("""
+                INSERT INTO predictions (user_id, crop, nitrogen, phosphorus, potassium, temperature, humidity, ph, rainfall, created_at)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s) RETURNING id
+            """, (user_id, crop, nitrogen, phosphorus, potassium, temperature, humidity, ph, rainfall,
+                  created_at)).fetchone()
+        return row[0]
+
+    def list_before(self, cutoff, limit):
+        rows = self.conn.execute(
+            f"SELECT {columns(Prediction)} FROM predictions WHERE created_at < %s ORDER BY created_at LIMIT %s",
+            (cutoff, limit))
+        return [Prediction._make(row) for row in rows]
+
+    def existing_ids(self, ids):
+        rows = self.conn.execute(f"SELECT id FROM predictions WHERE id IN ({placeholders(ids)})", ids)
+        return {row[0] for row in rows}
+
+    def delete_many(self, ids):
+        with self.conn.transaction():
+            self.conn.execute(f"DELETE FROM predictions WHERE id IN ({placeholders(ids)})", ids)
+
+
+class PostgresCrops(PostgresRepository, CropRepository):
+    def list_all(self):
+        return [Crop._make(row) for row in self.conn.execute(f"SELECT {columns(Crop)} FROM crops ORDER BY id")]
+
+    def get(self, crop_id):
+        row = self.conn.execute(f"SELECT {columns(Crop)} FROM crops WHERE id=%s", (crop_id,)).fetchone()
+        return Crop._make(row) if row else None
+
+    def add(self, **fields):
+        names = [name for name in CROP_FIELDS if name in fields]
+        with self.conn.transaction():
+            row = self.conn.execute(
+                f"INSERT INTO crops ({', '.join(names)}) VALUES ({placeholders(names)}) RETURNING id",
+                [fields[name] for name in names]).fetchone()
+        return row[0]
+
+    def update(self, crop_id, **fields):
+        names = [name for name in CROP_FIELDS if name in fields]
+        with self.conn.transaction():
+            self.conn.execute(
+                f"UPDATE crops SET {', '.join(f'{name}=%s' for name in names)} WHERE id=%s",
+                [fields[name] for name in names] + [crop_id])
+
+    def delete(self, crop_id):
+        with self.conn.transaction():
+            self.conn.execute("DELETE FROM crops WHERE id=%s", (crop_id,))
+
+
+class PostgresCropsInfo(PostgresRepository, CropInfoRepository):
+    def list_all(self):
+        rows = self.conn.execute(f"SELECT {columns(CropInfo)} FROM crops_info ORDER BY id")
+        return [CropInfo._make(row) for row in rows]
+
+    def get(self, crop_id):
+        row = self.conn.execute(f"SELECT {columns(CropInfo)} FROM crops_info WHERE id=%s", (crop_id,)).fetchone()
+        return CropInfo._make(row) if row else None
+
+    def get_by_name(self, name):
+        row = self.conn.execute(f"SELECT {columns(CropInfo)} FROM crops_info WHERE name=%s", (name,)).fetchone()
+        return CropInfo._make(row) if row else None
+
+    def add(self, name, sowing_start, sowing_end):
+        with self.conn.transaction():
+            row = self.conn.execute(
+                "INSERT INTO crops_info (name, sowing_start, sowing_end) VALUES (%s, %s, %s) RETURNING id",
+                (name, sowing_start, sowing_end)).fetchone()
+            bump_table_version(self.conn, "crops_info")
+        return row[0]
+
+    def update(self, crop_id, name, sowing_start, sowing_end):
+        with self.conn.transaction():
+            self.conn.execute("UPDATE crops_info SET name=%s, sowing_start=%s, sowing_end=%s WHERE id=%s",
+                              (name, sowing_start, sowing_end, crop_id))
+            bump_table_version(self.conn, "crops_info")
+
+    def delete(self, crop_id):
+        with self.conn.transaction():
+            self.conn.execute("DELETE FROM crop_tasks WHERE crop_id=%s", (crop_id,))
+            self.conn.execute("DELETE FROM crops_info WHERE id=%s", (crop_id,))
+            bump_table_version(self.conn, "crops_info")
+
+    def version(self):
+        row = self.conn.execute("SELECT version FROM table_versions WHERE name='crops_info'").fetchone()
+        return row[0] if row else 0
+
+
+class PostgresCropTasks(PostgresRepository, CropTaskRepository):
+    def list_for_crop(self, crop_id):
+        rows = self.conn.execute(f"SELECT {columns(CropTask)} FROM crop_tasks WHERE crop_id=%s ORDER BY id",
+                                 (crop_id,))
+        return [CropTask._make(row) for row in rows]
+
+    def add(self, crop_id, task_type, day_offset, notes):
+        with self.conn.transaction():
+            row = self.conn.execute("""
+                INSERT INTO crop_tasks (crop_id, task_type, day_offset, notes)
+                VALUES (%s, %s, %s, %s) RETURNING id
+            """, (crop_id, task_type, day_offset, notes)).fetchone()
+        return row[0]
+
+    def delete(self, task_id):
+        with self.conn.transaction():
+            row = self.conn.execute("DELETE FROM crop_tasks WHERE id=%s RETURNING crop_id", (task_id,)).fetchone()
+        return row[0] if row else None
+
+
+class PostgresCustomEvents(PostgresRepository, CustomEventRepository):
+    def list_for_user(self, user_id):
+        rows = self.conn.execute(f"SELECT {columns(CustomEvent)} FROM custom_events WHERE user_id=%s ORDER BY id",
+                                 (user_id,))
+        return [CustomEvent._make(row) for row in rows]
+
+    def list_on_date(self, date):
+        rows = self.conn.execute(f"SELECT {columns(CustomEvent)} FROM custom_events WHERE date=%s ORDER BY id",
+                                 (date,))
+        return [CustomEvent._make(row) for row in rows]
+
+    def add(self, user_id, title, date, notes):
+        with self.conn.transaction():
+            row = self.conn.execute("""
+                INSERT INTO custom_events (user_id, title, date, notes)
+                VALUES (%s, %s, %s, %s) RETURNING id
+            """, (user_id, title, date, notes)).fetchone()
+            bump_events_version(self.conn, user_id)
+        return row[0]
+
+    def delete(self, event_id):
+        with self.conn.transaction():
+            row = self.conn.execute("DELETE FROM custom_events WHERE id=%s RETURNING user_id",
+                                    (event_id,)).fetchone()
+            if row:
+                bump_events_version(self.conn, row[0])
+
+
+class PostgresAutoEvents(PostgresRepository, AutoEventRepository):
+    def list_for_user(self, user_id):
+        rows = self.conn.execute(f"SELECT {columns(AutoEvent)} FROM auto_events WHERE user_id=%s ORDER BY id",
+                                 (user_id,))
+        return [AutoEvent._make(row) for row in rows]
+
+    def list_on_date(self, date):
+        rows = self.conn.execute(f"SELECT {columns(AutoEvent)} FROM auto_events WHERE date=%s ORDER BY id",
+                                 (date,))
+        return [AutoEvent._make(row) for row in rows]
+
+    def add_many(self, user_id, crop_name, events):
+        with self.conn.transaction():
+            self.conn.cursor().executemany("""
+                INSERT INTO auto_events (user_id, title, date, notes, crop_name)
+                VALUES (%s, %s, %s, %s, %s)
+            """, [(user_id, title, date, notes, crop_name) for title, date, notes in events])
+            bump_events_version(self.conn, user_id)
+
+    def delete(self, event_id):
+        with self.conn.transaction():
+            row = self.conn.execute("DELETE FROM auto_events WHERE id=%s RETURNING user_id",
+                                    (event_id,)).fetchone()
+            if row:
+                bump_events_version(self.conn, row[0])
+
+    def list_before(self, cutoff, limit):
+        rows = self.conn.execute(
+            f"SELECT {columns(AutoEvent)} FROM auto_events WHERE date < %s ORDER BY date LIMIT %s",
+            (cutoff, limit))
+        return [AutoEvent._make(row) for row in rows]
+
+    def existing_ids(self, ids):
+        rows = self.conn.execute(f"SELECT id FROM auto_events WHERE id IN ({placeholders(ids)})", ids)
+        return {row[0] for row in rows}
+
+    def delete_many(self, ids):
+        with self.conn.transaction():
+            owners = self.conn.execute(
+                f"DELETE FROM auto_events WHERE id IN ({placeholders(ids)}) RETURNING user_id", ids).fetchall()
+            for user_id in sorted({row[0] for row in owners}):
+                bump_events_version(self.conn, user_id)
+
+
+class PostgresCalendar(PostgresRepository, CalendarRepository):
+    def version(self, user_id):
+        row = self.conn.execute("SELECT version FROM event_versions WHERE user_id=%s", (user_id,)).fetchone()
+        return row[0] if row else 0
+
+    def iter_events(self, user_id):
+        rows = self.stream("""
+            SELECT 'custom', id, title, date, notes FROM custom_events WHERE user_id=%s
+            UNION ALL
+            SELECT 'auto', id, title, date, notes FROM auto_events WHERE user_id=%s
+        """, (user_id, user_id))
+        for row in rows:
+            yield CalendarEntry._make(row)
+
+    def feed_token(self, user_id):
+        row = self.conn.execute("SELECT token FROM feed_tokens WHERE user_id=%s", (user_id,)).fetchone()
+        if row:
+            return row[0]
+        with self.conn.transaction():
+            self.conn.execute("INSERT INTO feed_tokens (user_id, token) VALUES (%s, %s) ON CONFLICT DO NOTHING",
+                              (user_id, secrets.token_urlsafe(24)))
+        # Re-read in case a concurrent request created it first
+        return self.conn.execute("SELECT token FROM feed_tokens WHERE user_id=%s", (user_id,)).fetchone()[0]
+
+    def rotate_feed_token(self, user_id):
+        token = secrets.token_urlsafe(24)
+        with self.conn.transaction():
+            self.conn.execute("""
+                INSERT INTO feed_tokens (user_id, token) VALUES (%s, %s)
+                ON CONFLICT (user_id) DO UPDATE SET token = excluded.token
+            """, (user_id, token))
+        return token
+
+    def user_for_feed_token(self, token):
+        row = self.conn.execute("SELECT user_id FROM feed_tokens WHERE token=%s", (token,)).fetchone()
+        return row[0] if row else None
+
+
+class PostgresReminders(PostgresRepository, ReminderRepository):
+    def start_run(self, run_date, days):
+        with self.conn.transaction():
+            self.conn.execute("INSERT INTO reminder_runs (run_date, days) VALUES (%s, %s) ON CONFLICT DO NOTHING",
+                              (run_date, days))
+        row = self.conn.execute("SELECT last_user_id, finished FROM reminder_runs WHERE run_date=%s AND days=%s",
+                                (run_date, days)).fetchone()
+        return ReminderRun(row[0], bool(row[1]))
+
+    def checkpoint(self, run_date, days, last_user_id):
+        with self.conn.transaction():
+            self.conn.execute("UPDATE reminder_runs SET last_user_id=%s WHERE run_date=%s AND days=%s",
+                              (last_user_id, run_date, days))
+
+    def finish(self, run_date, days):
+        with self.conn.transaction():
+            self.conn.execute("UPDATE reminder_runs SET finished=TRUE WHERE run_date=%s AND days=%s",
+                              (run_date, days))
+
+    def iter_upcoming(self, start, end, after_user_id):
+        # Both tables are range-scanned on their (date, user_id) index, so only
+        # the window's rows get sorted, and server-side: one streamed query
+        # per sweep instead of a cursor per day
+        rows = self.stream("""
+            SELECT e.user_id, u.email, u.fullname, e.title, e.date, e.crop_name
+            FROM (
+                SELECT user_id, title, date, NULL AS crop_name FROM custom_events
+                WHERE date BETWEEN %s AND %s AND user_id > %s
+                UNION ALL
+                SELECT user_id, title, date, crop_name FROM auto_events
+                WHERE date BETWEEN %s AND %s AND user_id > %s
+            ) e
+            JOIN users u ON u.id = e.user_id
+            ORDER BY e.user_id, e.date
+        """, (start, end, after_user_id, start, end, after_user_id))
+        for row in rows:
+            yield ReminderRow._make(row)
+
+
+class PostgresRateLimits(PostgresRepository, RateLimitRepository):
+    def take(self, key, per_minute, burst, cost=1):
+        rate = per_minute / 60.0
+        now = time.time()
+        try:
+            # Refill and take in one statement, so concurrent workers can't both
+            # spend the same tokens; the WHERE leaves the bucket alone if it's short
+            with self.conn.transaction():
+                # Shed instead of queueing behind a long-held row lock
+                self.conn.execute(f"SET LOCAL lock_timeout = '{LIMITER_LOCK_TIMEOUT_MS}ms'")
+                c = self.conn.execute("""
+                    INSERT INTO rate_buckets (key, tokens, updated_at) VALUES (%s, %s, %s)
+                    ON CONFLICT (key) DO UPDATE SET
+                        tokens = LEAST(%s, rate_buckets.tokens + (excluded.updated_at - rate_buckets.updated_at) * %s) - %s,
+                        updated_at = excluded.updated_at
+                    WHERE LEAST(%s, rate_buckets.tokens + (excluded.updated_at - rate_buckets.updated_at) * %s) >= %s
+                """, (key, burst - cost, now, burst, rate, cost, burst, rate, cost))
+            if c.rowcount:
+                return 0
+            tokens, updated_at = self.conn.execute(
+                "SELECT tokens, updated_at FROM rate_buckets WHERE key=%s", (key,)).fetchone()
+        except self.driver.OperationalError as e:
+            raise StorageBusy(str(e)) from e
+        available = min(burst, tokens + (now - updated_at) * rate)
+        return max((cost - available) / rate, 1)
+
+    def refund(self, key, burst, cost=1):
+        try:
+            with self.conn.transaction():
+                self.conn.execute(f"SET LOCAL lock_timeout = '{LIMITER_LOCK_TIMEOUT_MS}ms'")
+                self.conn.execute("UPDATE rate_buckets SET tokens = LEAST(%s, tokens + %s) WHERE key=%s",
+                                  (burst, cost, key))
+        except self.driver.OperationalError as e:
+            raise StorageBusy(str(e)) from e
+
+    def expire(self, idle_seconds):
+        # A missing bucket is recreated full by take(), so this only frees space
+        with self.conn.transaction():
+            c = self.conn.execute("DELETE FROM rate_buckets WHERE updated_at < %s", (time.time() - idle_seconds,))
+        return c.rowcount
+
+    def list_buckets(self, prefix):
+        rows = self.conn.execute(f"SELECT {columns(RateBucket)} FROM rate_buckets WHERE key LIKE %s ORDER BY key",
+                                 (prefix + "%",))
+        return [RateBucket._make(row) for row in rows]
+
+
+class PostgresStorage(Storage):
+    def __init__(self, url, **pool_options):
+        self.driver, self.pool = shared_pool(url, **pool_options)
+        self._conn = None
+        # Set when the connection can't go back to the pool as it is
+        self.discard = False
+        self.users = PostgresUsers(self)
+        self.predictions = PostgresPredictions(self)
+        self.crops = PostgresCrops(self)
+        self.crops_info = PostgresCropsInfo(self)
+        self.crop_tasks = PostgresCropTasks(self)
+        self.custom_events = PostgresCustomEvents(self)
+        self.auto_events = PostgresAutoEvents(self)
+        self.calendar = PostgresCalendar(self)
+        self.reminders = PostgresReminders(self)
+        self.rate_limits = PostgresRateLimits(self)
+
+    @property
+    def conn(self):
+        # Borrowed on first use, so requests that never touch the database
+        # don't take a connection from the pool
+        if self._conn is None:
+            self._conn = self.pool.acquire()
+        return self._conn
+
+    def migrate(self):
+        conn = self.conn
+        with conn.transaction():
+            # Released at commit; DDL is transactional, so a failed step leaves nothing behind
+            conn.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATION_LOCK,))
+            conn.execute("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)")
+            row = conn.execute("SELECT version FROM schema_version").fetchone()
+            version = row[0] if row else 0
+            for number, statements in enumerate(MIGRATIONS[version:], start=version + 1):
+                for statement in statements:
+                    conn.execute(statement)
+            if row is None:
+                conn.execute("INSERT INTO schema_version (version) VALUES (%s)", (len(MIGRATIONS),))
+            elif version < len(MIGRATIONS):
+                conn.execute("UPDATE schema_version SET version = %s", (len(MIGRATIONS),))
+
+    def compact(self, full=False):
+        # VACUUM can't run inside a transaction; pooled connections autocommit
+        conn = self.conn
+        size_before = conn.execute("SELECT pg_database_size(current_database())").fetchone()[0]
+        started = time.perf_counter()
+        # Plain VACUUM runs alongside other writers and makes dead rows'
+        # space reusable; only FULL rewrites tables to return it to the OS
+        conn.execute("VACUUM (FULL, ANALYZE)" if full else "VACUUM (ANALYZE)")
+        seconds = time.perf_counter() - started
+        size_after = conn.execute("SELECT pg_database_size(current_database())").fetchone()[0]
+        return {"bytes_reclaimed": max(size_before - size_after, 0), "seconds": seconds, "pending_full": False}
+
+    def close(self):
+        if self._conn is not None:
+            self.pool.release(self._conn, discard=self.discard)
+            self._conn = None
+            self.discard = False
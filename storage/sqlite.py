@@ -0,0 +1,619 @@
+"""SQLite backend: the repositories from storage.base over a single file."""
+import heapq
+import secrets
+import sqlite3
+import time
+from datetime import date, timedelta
+
+from storage.base import (
+    AutoEvent, AutoEventRepository, CalendarEntry, CalendarRepository, Crop, CROP_FIELDS,
+    CropInfo, CropInfoRepository, CropRepository, CropTask, CropTaskRepository, CustomEvent,
+    CustomEventRepository, DuplicateError, Prediction, PredictionRepository, RateBucket,
+    RateLimitRepository, ReminderRepository, ReminderRow, ReminderRun, Storage, StorageBusy, User,
+    UserRepository,
+)
+
+# Schema migrations, applied in order. The database's PRAGMA user_version
+# records how many have run; append new steps, never edit released ones.
+MIGRATIONS = [
+    # 1: initial schema (IF NOT EXISTS so databases created before
+    # versioning are adopted as-is)
+    [
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            fullname TEXT NOT NULL,
+            email TEXT UNIQUE NOT NULL,
+            username TEXT UNIQUE NOT NULL,
+            password TEXT NOT NULL,
+            role TEXT NOT NULL DEFAULT 'user'
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS predictions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            crop TEXT,
+            nitrogen REAL,
+            phosphorus REAL,
+            potassium REAL,
+            temperature REAL,
+            humidity REAL,
+            ph REAL,
+            rainfall REAL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY(user_id) REFERENCES users(id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS crops (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            scientific_name TEXT,
+            category TEXT,
+            best_season TEXT,
+            optimal_growing_conditions TEXT,
+            growth_duration TEXT,
+            growing_stages TEXT,
+            pest_requirements TEXT,
+            water_required TEXT,
+            description TEXT,
+            image_url TEXT
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS crops_info (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            sowing_start TEXT,
+            sowing_end TEXT
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS crop_tasks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            crop_id INTEGER NOT NULL,
+            task_type TEXT NOT NULL,
+            day_offset INTEGER NOT NULL,
+            notes TEXT,
+            FOREIGN KEY(crop_id) REFERENCES crops_info(id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS custom_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            title TEXT NOT NULL,
+            date TEXT NOT NULL,
+            notes TEXT,
+            FOREIGN KEY(user_id) REFERENCES users(id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS auto_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            title TEXT NOT NULL,
+            date TEXT NOT NULL,
+            notes TEXT,
+            crop_name TEXT,
+            FOREIGN KEY(user_id) REFERENCES users(id)
+        )
+        """,
+    ],
+    # 2: date indexes used by prune-db
+    [
+        "CREATE INDEX IF NOT EXISTS idx_auto_events_date ON auto_events(date)",
+        "CREATE INDEX IF NOT EXISTS idx_predictions_created_at ON predictions(created_at)",
+    ],
+    # 3: per-user events version for the ICS feed ETag
+    [
+        """
+        CREATE TABLE IF NOT EXISTS event_versions (
+            user_id INTEGER PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0,
+            FOREIGN KEY(user_id) REFERENCES users(id)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_custom_events_user_date ON custom_events(user_id, date)",
+        "CREATE INDEX IF NOT EXISTS idx_auto_events_user_date ON auto_events(user_id, date)",
+    ],
+    # 4: (date, user_id) indexes for the reminder sweep, which reads each day
+    # of its window in user order, and its resume checkpoints per window
+    [
+        "CREATE INDEX IF NOT EXISTS idx_custom_events_date_user ON custom_events(date, user_id)",
+        "CREATE INDEX IF NOT EXISTS idx_auto_events_date_user ON auto_events(date, user_id)",
+        # Covered by the index above, which prune-db uses just as well
+        "DROP INDEX IF EXISTS idx_auto_events_date",
+        """
+        CREATE TABLE IF NOT EXISTS reminder_runs (
+            run_date TEXT NOT NULL,
+            days INTEGER NOT NULL,
+            last_user_id INTEGER NOT NULL DEFAULT 0,
+            finished INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (run_date, days)
+        )
+        """,
+    ],
+    # 5: change counters for tables cached in memory by every worker
+    [
+        """
+        CREATE TABLE IF NOT EXISTS table_versions (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+        """,
+    ],
+    # 6: token buckets shared by all workers for rate limiting
+    [
+        """
+        CREATE TABLE IF NOT EXISTS rate_buckets (
+            key TEXT PRIMARY KEY,
+            tokens REAL NOT NULL,
+            updated_at REAL NOT NULL
+        )
+        """,
+    ],
+    # 7: random, rotatable calendar feed tokens
+    [
+        """
+        CREATE TABLE IF NOT EXISTS feed_tokens (
+            user_id INTEGER PRIMARY KEY,
+            token TEXT UNIQUE NOT NULL,
+            FOREIGN KEY(user_id) REFERENCES users(id)
+        )
+        """,
+    ],
+]
+
+
+def columns(record):
+    return ", ".join(record._fields)
+
+
+def placeholders(values):
+    return ",".join("?" * len(values))
+
+
+def iter_dates(start, end):
+    # Every YYYY-MM-DD from start to end inclusive
+    day, last = date.fromisoformat(start), date.fromisoformat(end)
+    while day <= last:
+        yield day.isoformat()
+        day += timedelta(days=1)
+
+
+def bump_events_version(conn, user_id):
+    conn.execute("""
+        INSERT INTO event_versions (user_id, version) VALUES (?, 1)
+        ON CONFLICT(user_id) DO UPDATE SET version = version + 1
+    """, (user_id,))
+
+
+def bump_table_version(conn, name):
+    conn.execute("""
+        INSERT INTO table_versions (name, version) VALUES (?, 1)
+        ON CONFLICT(name) DO UPDATE SET version = version + 1
+    """, (name,))
+
+
+class SQLiteRepository:
+    def __init__(self, conn):
+        self.conn = conn
+
+
+class SQLiteUsers(SQLiteRepository, UserRepository):
+    def get_by_email(self, email):
+        row = self.conn.execute(f"SELECT {columns(User)} FROM users WHERE email=?", (email,)).fetchone()
+        return User._make(row) if row else None
+
+    def add(self, fullname, email, username, password, role="user"):
+        try:
+            with self.conn:
+                c = self.conn.execute(
+                    "INSERT INTO users (fullname, email, username, password, role) VALUES (?, ?, ?, ?, ?)",
+                    (fullname, email, username, password, role))
+        except sqlite3.IntegrityError as e:
+            raise DuplicateError(str(e)) from e
+        return c.lastrowid
+
+    def list_all(self):
+        return [User._make(row) for row in self.conn.execute(f"SELECT {columns(User)} FROM users")]
+
+    def set_role(self, user_id, role):
+        with self.conn:
+            self.conn.execute("UPDATE users SET role = ? WHERE id = ?", (role, user_id))
+
+
+class SQLitePredictions(SQLiteRepository, PredictionRepository):
+    def add(self, user_id, crop, nitrogen, phosphorus, potassium, temperature, humidity, ph, rainfall):
+        with self.conn:
+            c = self.conn.execute("""
+                INSERT INTO predictions (user_id, crop, nitrogen, phosphorus, potassium, temperature, humidity, ph, rainfall)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (user_id, crop, nitrogen, phosphorus, potassium, temperature, humidity, ph, rainfall))
+        return c.lastrowid
+
+    def list_before(self, cutoff, limit):
+        rows = self.conn.execute(
+            f"SELECT {columns(Prediction)} FROM predictions WHERE created_at < ? ORDER BY created_at LIMIT ?",
+            (cutoff, limit))
+        return [Prediction._make(row) for row in rows]
+
+    def existing_ids(self, ids):
+        rows = self.conn.execute(f"SELECT id FROM predictions WHERE id IN ({placeholders(ids)})", ids)
+        return {row[0] for row in rows}
+
+    def delete_many(self, ids):
+        with self.conn:
+            self.conn.execute(f"DELETE FROM predictions WHERE id IN ({placeholders(ids)})", ids)
+
+
+class SQLiteCrops(SQLiteRepository, CropRepository):
+    def list_all(self):
+        return [Crop._make(row) for row in self.conn.execute(f"SELECT {columns(Crop)} FROM crops")]
+
+    def get(self, crop_id):
+        row = self.conn.execute(f"SELECT {columns(Crop)} FROM crops WHERE id=?", (crop_id,)).fetchone()
+        return Crop._make(row) if row else None
+
+    def add(self, **fields):
+        names = [name for name in CROP_FIELDS if name in fields]
+        with self.conn:
+            c = self.conn.execute(
+                f"INSERT INTO crops ({', '.join(names)}) VALUES ({placeholders(names)})",
+                [fields[name] for name in names])
+        return c.lastrowid
+
+    def update(self, crop_id, **fields):
+        names = [name for name in CROP_FIELDS if name in fields]
+        with self.conn:
+            self.conn.execute(
+                f"UPDATE crops SET {', '.join(f'{name}=?' for name in names)} WHERE id=?",
+                [fields[name] for name in names] + [crop_id])
+
+    def delete(self, crop_id):
+        with self.conn:
+            self.conn.execute("DELETE FROM crops WHERE id=?", (crop_id,))
+
+
+class SQLiteCropsInfo(SQLiteRepository, CropInfoRepository):
+    def list_all(self):
+        return [CropInfo._make(row) for row in self.conn.execute(f"SELECT {columns(CropInfo)} FROM crops_info")]
+
+    def get(self, crop_id):
+        row = self.conn.execute(f"SELECT {columns(CropInfo)} FROM crops_info WHERE id=?", (crop_id,)).fetchone()
+        return CropInfo._make(row) if row else None
+
+    def get_by_name(self, name):
+        row = self.conn.execute(f"SELECT {columns(CropInfo)} FROM crops_info WHERE name=?", (name,)).fetchone()
+        return CropInfo._make(row) if row else None
+
+    def add(self, name, sowing_start, sowing_end):
+        with self.conn:
+            c = self.conn.execute("INSERT INTO crops_info (name, sowing_start, sowing_end) VALUES (?, ?, ?)",
+                                  (name, sowing_start, sowing_end))
+            bump_table_version(self.conn, "crops_info")
+        return c.lastrowid
+
+    def update(self, crop_id, name, sowing_start, sowing_end):
+        with self.conn:
+            self.conn.execute("UPDATE crops_info SET name=?, sowing_start=?, sowing_end=? WHERE id=?",
+                              (name, sowing_start, sowing_end, crop_id))
+            bump_table_version(self.conn, "crops_info")
+
+    def delete(self, crop_id):
+        with self.conn:
+            self.conn.execute("DELETE FROM crop_tasks WHERE crop_id=?", (crop_id,))
+            self.conn.execute("DELETE FROM crops_info WHERE id=?", (crop_id,))
+            bump_table_version(self.conn, "crops_info")
+
+    def version(self):
+        row = self.conn.execute("SELECT version FROM table_versions WHERE name='crops_info'").fetchone()
+        return row[0] if row else 0
+
+
+class SQLiteCropTasks(SQLiteRepository, CropTaskRepository):
+    def list_for_crop(self, crop_id):
+        rows = self.conn.execute(f"SELECT {columns(CropTask)} FROM crop_tasks WHERE crop_id=?", (crop_id,))
+        return [CropTask._make(row) for row in rows]
+
+    def add(self, crop_id, task_type, day_offset, notes):
+        with self.conn:
+            c = self.conn.execute(
+                "INSERT INTO crop_tasks (crop_id, task_type, day_offset, notes) VALUES (?, ?, ?, ?)",
+                (crop_id, task_type, day_offset, notes))
+        return c.lastrowid
+
+    def delete(self, task_id):
+        with self.conn:
+            row = self.conn.execute("SELECT crop_id FROM crop_tasks WHERE id=?", (task_id,)).fetchone()
+            if not row:
+                return None
+            self.conn.execute("DELETE FROM crop_tasks WHERE id=?", (task_id,))
+        return row[0]
+
+
+class SQLiteCustomEvents(SQLiteRepository, CustomEventRepository):
+    def list_for_user(self, user_id):
+        rows = self.conn.execute(f"SELECT {columns(CustomEvent)} FROM custom_events WHERE user_id=?", (user_id,))
+        return [CustomEvent._make(row) for row in rows]
+
+    def list_on_date(self, date):
+        rows = self.conn.execute(f"SELECT {columns(CustomEvent)} FROM custom_events WHERE date=?", (date,))
+        return [CustomEvent._make(row) for row in rows]
+
+    def add(self, user_id, title, date, notes):
+        with self.conn:
+            c = self.conn.execute("INSERT INTO custom_events (user_id, title, date, notes) VALUES (?, ?, ?, ?)",
+                                  (user_id, title, date, notes))
+            bump_events_version(self.conn, user_id)
+        return c.lastrowid
+
+    def delete(self, event_id):
+        with self.conn:
+            row = self.conn.execute("SELECT user_id FROM custom_events WHERE id=?", (event_id,)).fetchone()
+            if row:
+                self.conn.execute("DELETE FROM custom_events WHERE id=?", (event_id,))
+                bump_events_version(self.conn, row[0])
+
+
+class SQLiteAutoEvents(SQLiteRepository, AutoEventRepository):
+    def list_for_user(self, user_id):
+        rows = self.conn.execute(f"SELECT {columns(AutoEvent)} FROM auto_events WHERE user_id=?", (user_id,))
+        return [AutoEvent._make(row) for row in rows]
+
+    def list_on_date(self, date):
+        rows = self.conn.execute(f"SELECT {columns(AutoEvent)} FROM auto_events WHERE date=?", (date,))
+        return [AutoEvent._make(row) for row in rows]
+
+    def add_many(self, user_id, crop_name, events):
+        with self.conn:
+            self.conn.executemany("""
+                INSERT INTO auto_events (user_id, title, date, notes, crop_name)
+                VALUES (?, ?, ?, ?, ?)
+            """, [(user_id, title, date, notes, crop_name) for title, date, notes in events])
+            bump_events_version(self.conn, user_id)
+
+    def delete(self, event_id):
+        with self.conn:
+            row = self.conn.execute("SELECT user_id FROM auto_events WHERE id=?", (event_id,)).fetchone()
+            if row:
+                self.conn.execute("DELETE FROM auto_events WHERE id=?", (event_id,))
+                bump_events_version(self.conn, row[0])
+
+    def list_before(self, cutoff, limit):
+        rows = self.conn.execute(
+            f"SELECT {columns(AutoEvent)} FROM auto_events WHERE date < ? ORDER BY date LIMIT ?",
+            (cutoff, limit))
+        return [AutoEvent._make(row) for row in rows]
+
+    def existing_ids(self, ids):
+        rows = self.conn.execute(f"SELECT id FROM auto_events WHERE id IN ({placeholders(ids)})", ids)
+        return {row[0] for row in rows}
+
+    def delete_many(self, ids):
+        with self.conn:
+            owners =self.conn.execute(
+                f"SELECT DISTINCT user_id FROM auto_events WHERE id IN ({placeholders(ids)})", ids).fetchall()
+            self.conn.execute(f"DELETE FROM auto_events WHERE id IN ({placeholders(ids)})", ids)
+            for (user_id,) in owners:
+                bump_events_version(self.conn, user_id)
+
+
+class SQLiteCalendar(SQLiteRepository, CalendarRepository):
+    def version(self, user_id):
+        row = self.conn.execute("SELECT version FROM event_versions WHERE user_id=?", (user_id,)).fetchone()
+        return row[0] if row else 0
+
+    def iter_events(self, user_id):
+        rows = self.conn.execute("""
+            SELECT 'custom', id, title, date, notes FROM custom_events WHERE user_id=?
+            UNION ALL
+            SELECT 'auto', id, title, date, notes FROM auto_events WHERE user_id=?
+        """, (user_id, user_id))
+        for row in rows:
+            yield CalendarEntry._make(row)
+
+    def feed_token(self, user_id):
+        row = self.conn.execute("SELECT token FROM feed_tokens WHERE user_id=?", (user_id,)).fetchone()
+        if row:
+            return row[0]
+        with self.conn:
+            self.conn.execute("INSERT OR IGNORE INTO feed_tokens (user_id, token) VALUES (?, ?)",
+                              (user_id, secrets.token_urlsafe(24)))
+        # Re-read in case a concurrent request created it first
+        return self.conn.execute("SELECT token FROM feed_tokens WHERE user_id=?", (user_id,)).fetchone()[0]
+
+    def rotate_feed_token(self, user_id):
+        token = secrets.token_urlsafe(24)
+        with self.conn:
+            self.conn.execute("""
+                INSERT INTO feed_tokens (user_id, token) VALUES (?, ?)
+                ON CONFLICT(user_id) DO UPDATE SET token=excluded.token
+            """, (user_id, token))
+        return token
+
+    def user_for_feed_token(self, token):
+        row = self.conn.execute("SELECT user_id FROM feed_tokens WHERE token=?", (token,)).fetchone()
+        return row[0] if row else None
+
+
+class SQLiteReminders(SQLiteRepository, ReminderRepository):
+    def start_run(self, run_date, days):
+        with self.conn:
+            self.conn.execute("INSERT OR IGNORE INTO reminder_runs (run_date, days) VALUES (?, ?)",
+                              (run_date, days))
+        row = self.conn.execute("SELECT last_user_id, finished FROM reminder_runs WHERE run_date=? AND days=?",
+                                (run_date, days)).fetchone()
+        return ReminderRun(row[0], bool(row[1]))
+
+    def checkpoint(self, run_date, days, last_user_id):
+        with self.conn:
+            self.conn.execute("UPDATE reminder_runs SET last_user_id=? WHERE run_date=? AND days=?",
+                              (last_user_id, run_date, days))
+
+    def finish(self, run_date, days):
+        with self.conn:
+            self.conn.execute("UPDATE reminder_runs SET finished=1 WHERE run_date=? AND days=?", (run_date, days))
+
+    def iter_upcoming(self, start, end, after_user_id):
+        # One indexed slice per table and day of the window, each read in user
+        # order off its (date, user_id) index; merging them streams the whole
+        # window in (user_id, date) order without sorting it
+        def upcoming(table, crop_name, day):
+            rows = self.conn.execute(f"""
+                SELECT e.user_id, u.email, u.fullname, e.title, e.date, {crop_name}
+                FROM {table} e
+                JOIN users u ON u.id = e.user_id
+                WHERE e.date = ? AND e.user_id > ?
+                ORDER BY e.user_id
+            """, (day, after_user_id))
+            return map(ReminderRow._make, rows)
+
+        slices = []
+        for day in iter_dates(start, end):
+            slices.append(upcoming("custom_events", "NULL", day))
+            slices.append(upcoming("auto_events", "e.crop_name", day))
+        yield from heapq.merge(*slices, key=lambda row: (row.user_id, row.date))
+
+
+class SQLiteRateLimits(SQLiteRepository, RateLimitRepository):
+    # Admission checks must answer fast even when the database is busy, so
+    # take/refund use their own connection with a short busy timeout instead
+    # of queueing behind other writers for the session's full timeout.
+    # Maintenance (expire, list_buckets) can wait and uses the session's.
+    def __init__(self, conn, path, timeout):
+        super().__init__(conn)
+        self.path = path
+        self.timeout = timeout
+        self._limiter = None
+
+    @property
+    def limiter(self):
+        if self._limiter is None:
+            self._limiter = sqlite3.connect(self.path, timeout=self.timeout)
+        return self._limiter
+
+    def close(self):
+        if self._limiter is not None:
+            self._limiter.close()
+
+    def take(self, key, per_minute, burst, cost=1):
+        try:
+            return self._take(key, per_minute, burst, cost)
+        except sqlite3.OperationalError as e:
+            raise StorageBusy(str(e)) from e
+
+    def _take(self, key, per_minute, burst, cost):
+        rate = per_minute / 60.0
+        now = time.time()
+        # Refill and take in one statement, so concurrent workers can't both
+        # spend the same tokens; the WHERE leaves the bucket alone if it's short
+        with self.limiter:
+            c = self.limiter.execute("""
+                INSERT INTO rate_buckets (key, tokens, updated_at) VALUES (?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET
+                    tokens = MIN(?, tokens + (excluded.updated_at - updated_at) * ?) - ?,
+                    updated_at = excluded.updated_at
+                WHERE MIN(?, tokens + (excluded.updated_at - updated_at) * ?) >= ?
+            """, (key, burst - cost, now, burst, rate, cost, burst, rate, cost))
+        if c.rowcount:
+            return 0
+
+        tokens, updated_at = self.limiter.execute(
+            "SELECT tokens, updated_at FROM rate_buckets WHERE key=?", (key,)).fetchone()
+        available = min(burst, tokens + (now - updated_at) * rate)
+        return max((cost - available) / rate, 1)
+
+    def refund(self, key, burst, cost=1):
+        try:
+            with self.limiter:
+                self.limiter.execute("UPDATE rate_buckets SET tokens = MIN(?, tokens + ?) WHERE key=?",
+                                     (burst, cost, key))
+        except sqlite3.OperationalError as e:
+            raise StorageBusy(str(e)) from e
+
+    def expire(self, idle_seconds):
+        # A missing bucket is recreated full by take(), so this only frees space
+        with self.conn:
+            c = self.conn.execute("DELETE FROM rate_buckets WHERE updated_at < ?", (time.time() - idle_seconds,))
+        return c.rowcount
+
+    def list_buckets(self, prefix):
+        rows = self.conn.execute(f"SELECT {columns(RateBucket)} FROM rate_buckets WHERE key LIKE ?",
+                                 (prefix + "%",))
+        return [RateBucket._make(row) for row in rows]
+
+
+class SQLiteStorage(Storage):
+    def __init__(self, path, timeout=30, limiter_timeout=0.1):
+        self.conn = sqlite3.connect(path, timeout=timeout)
+        self.users = SQLiteUsers(self.conn)
+        self.predictions = SQLitePredictions(self.conn)
+        self.crops = SQLiteCrops(self.conn)
+        self.crops_info = SQLiteCropsInfo(self.conn)
+        self.crop_tasks = SQLiteCropTasks(self.conn)
+        self.custom_events = SQLiteCustomEvents(self.conn)
+        self.auto_events = SQLiteAutoEvents(self.conn)
+        self.calendar = SQLiteCalendar(self.conn)
+        self.reminders = SQLiteReminders(self.conn)
+        self.rate_limits = SQLiteRateLimits(self.conn, path, limiter_timeout)
+
+    def migrate(self):
+        conn = self.conn
+        conn.isolation_level = None
+        try:
+            if conn.execute("PRAGMA page_count").fetchone()[0] == 0:
+                # Incremental vacuum lets prune-db give freed pages back to the OS;
+                # it only takes effect if set before the first table is created
+                conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            # WAL lets long read-only sweeps run without blocking web workers' writes
+            conn.execute("PRAGMA journal_mode = WAL")
+
+            # The write lock makes concurrently booting workers migrate one at a time
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                version = conn.execute("PRAGMA user_version").fetchone()[0]
+                for number, statements in enumerate(MIGRATIONS[version:], start=version + 1):
+                    for statement in statements:
+                        conn.execute(statement)
+                    conn.execute(f"PRAGMA user_version = {number}")
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        finally:
+            conn.isolation_level = ""
+
+    def compact(self, full=False):
+        conn = self.conn
+        conn.isolation_level = None
+        try:
+            page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+            pages_before = conn.execute("PRAGMA page_count").fetchone()[0]
+            incremental = conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+
+            started = time.perf_counter()
+            if not incremental and full:
+                # Older databases need one full VACUUM before incremental mode
+                # applies; it locks the whole file, so only on request
+                conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+                conn.execute("VACUUM")
+                incremental = True
+            if incremental:
+                conn.execute("PRAGMA incremental_vacuum")
+            # Measured before ANALYZE, which adds pages of its own for sqlite_stat1
+            pages_after = conn.execute("PRAGMA page_count").fetchone()[0]
+            conn.execute("ANALYZE")
+            seconds = time.perf_counter() - started
+        finally:
+            conn.isolation_level = ""
+
+        # The one-off switch to incremental mode adds pointer-map pages
+        reclaimed = max(pages_before - pages_after, 0) * page_size
+        return {"bytes_reclaimed": reclaimed, "seconds": seconds, "pending_full": not incremental}
+
+    def close(self):
+        self.rate_limits.close()
+        self.conn.close()
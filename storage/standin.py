@@ -0,0 +1,114 @@
+"""Local stand-in for the PostgreSQL driver, backed by a SQLite file.
+
+Implements the part of psycopg's API that storage.postgres uses (connect,
+Connection.execute/cursor/transaction, Cursor.stream/executemany) and
+rewrites the PostgreSQL-only bits of its SQL, so the pooled backend can be
+developed and tested without a database server:
+
+    DATABASE_URL=postgresql+standin:///standin.db flask run
+
+Lock timeouts (SET LOCAL) aren't emulated; the stand-in waits up to the
+connection's busy timeout instead. Use a real server for load testing.
+"""
+import os
+import re
+import sqlite3
+from contextlib import contextmanager
+
+Error = sqlite3.Error
+IntegrityError = sqlite3.IntegrityError
+OperationalError = sqlite3.OperationalError
+
+REWRITES = [
+    (re.compile(r"\bBIGSERIAL PRIMARY KEY\b"), "INTEGER PRIMARY KEY AUTOINCREMENT"),
+    (re.compile(r"%(s|%)"), lambda match: "?" if match.group(1) == "s" else "%"),
+]
+
+# Statements with no SQLite equivalent, mapped to what to run instead
+STATEMENTS = [
+    (re.compile(r"^\s*SET\s+LOCAL\b", re.I), []),
+    (re.compile(r"^\s*VACUUM\s*\(\s*ANALYZE\s*\)\s*$", re.I), ["ANALYZE"]),
+    (re.compile(r"^\s*VACUUM\s*\(\s*FULL\s*,\s*ANALYZE\s*\)\s*$", re.I), ["VACUUM", "ANALYZE"]),
+]
+
+
+def translate(sql):
+    for pattern, replacement in STATEMENTS:
+        if pattern.match(sql):
+            return replacement
+    for pattern, replacement in REWRITES:
+        sql = pattern.sub(replacement, sql)
+    return [sql]
+
+
+class Cursor:
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self.rowcount = -1
+
+    def execute(self, sql, params=()):
+        for statement in translate(sql):
+            self._cursor.execute(statement, params)
+        self.rowcount = self._cursor.rowcount
+        return self
+
+    def executemany(self, sql, params_seq):
+        (statement,) = translate(sql)
+        self._cursor.executemany(statement, params_seq)
+        self.rowcount = self._cursor.rowcount
+
+    def stream(self, sql, params=()):
+        yield from self.execute(sql, params)
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def close(self):
+        self._cursor.close()
+
+
+class Connection:
+    def __init__(self, path, timeout):
+        self.path = path
+        # Autocommit, like the pool's psycopg connections; writes go through
+        # transaction(). Pooled connections move between threads.
+        self._conn = sqlite3.connect(path, timeout=timeout, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.execute("PRAGMA foreign_keys = ON")
+        self._conn.create_function("least", -1, min, deterministic=True)
+        self._conn.create_function("greatest", -1, max, deterministic=True)
+        # The write lock taken by transaction() already serialises migrations
+        self._conn.create_function("pg_advisory_xact_lock", 1, lambda key: None)
+        self._conn.create_function("current_database", 0, lambda: self.path)
+        self._conn.create_function("pg_database_size", 1, os.path.getsize)
+        self.closed = False
+
+    def cursor(self):
+        return Cursor(self._conn.cursor())
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    @contextmanager
+    def transaction(self):
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._conn.execute("COMMIT")
+
+    def close(self):
+        self._conn.close()
+        self.closed = True
+
+
+def connect(path, timeout=5.0):
+    return Connection(path, timeout)
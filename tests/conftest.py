@@ -0,0 +1,37 @@
+import os
+
+import pytest
+
+from storage import open_storage
+
+
+@pytest.fixture(params=["sqlite", "postgresql+standin", "postgresql"])
+def database_url(request, tmp_path):
+    """Every storage test runs once per backend.
+
+    The PostgreSQL run needs a throwaway server database, e.g.
+    TEST_POSTGRES_URL=postgresql://postgres@localhost/crop_test; its public
+    schema is dropped before each test.
+    """
+    if request.param != "postgresql":
+        return f"{request.param}:///{tmp_path / 'test.db'}"
+    url = os.environ.get("TEST_POSTGRES_URL")
+    if not url:
+        pytest.skip("TEST_POSTGRES_URL is not set")
+    with open_storage(url) as storage:
+        storage.conn.execute("DROP SCHEMA public CASCADE")
+        storage.conn.execute("CREATE SCHEMA public")
+    return url
+
+
+@pytest.fixture
+def storage(database_url):
+    storage = open_storage(database_url)
+    storage.migrate()
+    yield storage
+    storage.close()
+
+
+@pytest.fixture
+def user_id(storage):
+    return storage.users.add("Asha Rao", "asha@example.com", "asha", "hash")
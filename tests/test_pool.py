@@ -0,0 +1,54 @@
+import time
+
+import pytest
+
+from storage import StorageBusy
+from storage.pool import ConnectionPool
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def test_connections_are_reused():
+    opened = []
+    pool = ConnectionPool(lambda: opened.append(FakeConnection()) or opened[-1], size=2)
+    first = pool.acquire()
+    pool.release(first)
+    assert pool.acquire() is first
+    assert len(opened) == 1
+
+
+def test_exhausted_pool_sheds_after_timeout():
+    pool = ConnectionPool(FakeConnection, size=1, timeout=0.05)
+    held = pool.acquire()
+    started = time.monotonic()
+    with pytest.raises(StorageBusy):
+        pool.acquire()
+    assert time.monotonic() - started < 1
+    pool.release(held)
+    assert pool.acquire() is held
+
+
+def test_discarded_connections_are_closed_and_replaced():
+    pool = ConnectionPool(FakeConnection, size=1)
+    broken = pool.acquire()
+    pool.release(broken, discard=True)
+    assert broken.closed
+    assert pool.acquire() is not broken
+
+
+def test_failed_connect_frees_its_slot():
+    def refuse():
+        raise OSError("connection refused")
+
+    pool = ConnectionPool(refuse, size=1, timeout=0.05)
+    for _ in range(2):
+        with pytest.raises(OSError):
+            pool.acquire()
+    pool.connect = FakeConnection
+    assert isinstance(pool.acquire(), FakeConnection)
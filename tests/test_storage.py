@@ -0,0 +1,196 @@
+"""Repository behaviour every backend must share; see conftest.database_url."""
+import threading
+
+import pytest
+
+from storage import DuplicateError, StorageBusy, open_storage
+
+
+def test_migrate_is_idempotent(database_url, storage):
+    storage.migrate()
+    with open_storage(database_url) as other:
+        other.migrate()
+        assert other.users.list_all() == []
+
+
+def test_users(storage, user_id):
+    user = storage.users.get_by_email("asha@example.com")
+    assert user.id == user_id
+    assert (user.fullname, user.username, user.role) == ("Asha Rao", "asha", "user")
+    assert storage.users.get_by_email("nobody@example.com") is None
+
+    with pytest.raises(DuplicateError):
+        storage.users.add("Asha Again", "asha@example.com", "asha2", "hash")
+    with pytest.raises(DuplicateError):
+        storage.users.add("Asha Again", "asha2@example.com", "asha", "hash")
+
+    storage.users.set_role(user_id, "admin")
+    assert [user.role for user in storage.users.list_all()] == ["admin"]
+
+
+def test_predictions(storage, user_id):
+    ids = [storage.predictions.add(user_id, "rice", 90, 42, 43, 20.8, 82.0, 6.5, 202.9) for _ in range(3)]
+    assert storage.predictions.list_before("1970-01-01", 10) == []
+
+    rows = storage.predictions.list_before("9999-12-31", 2)
+    assert len(rows) == 2
+    assert rows[0].crop == "rice" and rows[0].ph == 6.5
+
+    storage.predictions.delete_many(ids[:2])
+    assert storage.predictions.existing_ids(ids) == {ids[2]}
+
+
+def test_crops(storage):
+    crop_id = storage.crops.add(name="Rice", category="Cereal")
+    assert storage.crops.get(crop_id)[1:4] == ("Rice", None, "Cereal")
+
+    storage.crops.update(crop_id, name="Paddy", description="Wet fields")
+    crop = storage.crops.get(crop_id)
+    assert (crop.name, crop.category, crop.description) == ("Paddy", "Cereal", "Wet fields")
+
+    storage.crops.delete(crop_id)
+    assert storage.crops.get(crop_id) is None
+    assert storage.crops.list_all() == []
+
+
+def test_crops_info_version_and_tasks(storage):
+    assert storage.crops_info.version() == 0
+    crop_id = storage.crops_info.add("Maize", "06-01", "07-15")
+    storage.crops_info.update(crop_id, "Maize", None, None)
+    assert storage.crops_info.get_by_name("Maize").sowing_start is None
+    assert storage.crops_info.version() == 2
+
+    task_id = storage.crop_tasks.add(crop_id, "Irrigation", 10, "First watering")
+    other_id = storage.crop_tasks.add(crop_id, "Harvest", 100, None)
+    assert [task.task_type for task in storage.crop_tasks.list_for_crop(crop_id)] == ["Irrigation", "Harvest"]
+    assert storage.crop_tasks.delete(task_id) == crop_id
+    assert storage.crop_tasks.delete(task_id) is None
+
+    storage.crops_info.delete(crop_id)
+    assert storage.crops_info.get(crop_id) is None
+    assert storage.crop_tasks.list_for_crop(crop_id) == []
+    assert storage.crop_tasks.delete(other_id) is None
+    assert storage.crops_info.version() == 3
+
+
+def test_events_bump_calendar_version(storage, user_id):
+    assert storage.calendar.version(user_id) == 0
+    event_id = storage.custom_events.add(user_id, "Market day", "2026-03-01", "Sell onions")
+    storage.auto_events.add_many(user_id, "Rice", [("Sowing", "2026-06-01", None), ("Harvest", "2026-10-01", None)])
+    assert storage.calendar.version(user_id) == 2
+
+    entries = sorted(storage.calendar.iter_events(user_id), key=lambda entry: entry.date)
+    assert [(entry.kind, entry.title) for entry in entries] == [
+        ("custom", "Market day"), ("auto", "Sowing"), ("auto", "Harvest")]
+    assert [event.crop_name for event in storage.auto_events.list_on_date("2026-06-01")] == ["Rice"]
+    assert [event.title for event in storage.custom_events.list_on_date("2026-03-01")] == ["Market day"]
+
+    storage.custom_events.delete(event_id)
+    auto_ids = [event.id for event in storage.auto_events.list_before("2026-12-31", 10)]
+    assert [event.title for event in storage.auto_events.list_before("2026-12-31", 10)] == ["Sowing", "Harvest"]
+    storage.auto_events.delete_many(auto_ids)
+    assert storage.auto_events.existing_ids(auto_ids) == set()
+    assert list(storage.calendar.iter_events(user_id)) == []
+    assert storage.calendar.version(user_id) == 4
+
+
+def test_feed_tokens(storage, user_id):
+    token = storage.calendar.feed_token(user_id)
+    assert storage.calendar.feed_token(user_id) == token
+    assert storage.calendar.user_for_feed_token(token) == user_id
+
+    rotated = storage.calendar.rotate_feed_token(user_id)
+    assert rotated != token
+    assert storage.calendar.user_for_feed_token(token) is None
+    assert storage.calendar.user_for_feed_token(rotated) == user_id
+
+
+def test_reminder_runs(storage):
+    run = storage.reminders.start_run("2026-05-01", 3)
+    assert (run.last_user_id, run.finished) == (0, False)
+    storage.reminders.checkpoint("2026-05-01", 3, 42)
+    assert storage.reminders.start_run("2026-05-01", 3).last_user_id == 42
+    # A different window keeps its own checkpoint
+    assert storage.reminders.start_run("2026-05-01", 7).last_user_id == 0
+
+    storage.reminders.finish("2026-05-01", 3)
+    assert storage.reminders.start_run("2026-05-01", 3) == (42, True)
+
+
+def test_iter_upcoming_orders_by_user_then_date(storage):
+    first = storage.users.add("First", "first@example.com", "first", "hash")
+    second = storage.users.add("Second", "second@example.com", "second", "hash")
+    storage.auto_events.add_many(second, "Rice", [("Sowing", "2026-05-02", None), ("Late", "2026-05-09", None)])
+    storage.custom_events.add(second, "Market", "2026-05-01", None)
+    storage.custom_events.add(first, "Fence", "2026-05-03", None)
+    storage.custom_events.add(first, "Early", "2026-04-30", None)
+
+    rows = list(storage.reminders.iter_upcoming("2026-05-01", "2026-05-03", 0))
+    assert [(row.user_id, row.date, row.title, row.crop_name) for row in rows] == [
+        (first, "2026-05-03", "Fence", None),
+        (second, "2026-05-01", "Market", None),
+        (second, "2026-05-02", "Sowing", "Rice"),
+    ]
+    assert rows[0].email == "first@example.com" and rows[0].fullname == "First"
+    assert [row.user_id for row in storage.reminders.iter_upcoming("2026-05-01", "2026-05-03", first)] == [
+        second, second]
+
+
+def test_abandoned_stream_leaves_storage_usable(database_url, user_id):
+    with open_storage(database_url) as storage:
+        storage.auto_events.add_many(user_id, "Rice", [(f"Task {day}", f"2026-05-{day:02d}", None)
+                                                      for day in range(1, 29)])
+        rows = storage.calendar.iter_events(user_id)
+        next(rows)
+        rows.close()
+    with open_storage(database_url) as storage:
+        assert len(list(storage.calendar.iter_events(user_id))) == 28
+
+
+def test_rate_limits(storage):
+    for _ in range(3):
+        assert storage.rate_limits.take("user:1", per_minute=6, burst=3) == 0
+    wait = storage.rate_limits.take("user:1", per_minute=6, burst=3)
+    assert 1 <= wait <= 10
+
+    storage.rate_limits.refund("user:1", burst=3)
+    assert storage.rate_limits.take("user:1", per_minute=6, burst=3) == 0
+
+    storage.rate_limits.take("upstream:weather", per_minute=60, burst=5)
+    assert [bucket.key for bucket in storage.rate_limits.list_buckets("user:")] == ["user:1"]
+    assert storage.rate_limits.expire(3600) == 0
+    assert storage.rate_limits.expire(-1) == 2
+    assert storage.rate_limits.list_buckets("") == []
+
+
+def test_rate_limit_tokens_are_not_double_spent(database_url, storage):
+    taken, busy, lock = [], [], threading.Lock()
+
+    def client():
+        with open_storage(database_url) as session:
+            for _ in range(5):
+                try:
+                    wait = session.rate_limits.take("shared", per_minute=1, burst=10)
+                except StorageBusy:
+                    wait = None
+                with lock:
+                    (busy if wait is None else taken).append(wait)
+
+    threads = [threading.Thread(target=client) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Attempts shed as busy spend nothing; the rest drain exactly the burst
+    assert len(taken) + len(busy) == 30
+    assert taken.count(0) == min(10, len(taken))
+
+
+def test_compact(storage, user_id):
+    storage.predictions.delete_many([storage.predictions.add(user_id, "rice", 1, 2, 3, 4, 5, 6, 7)
+                                     for _ in range(50)])
+    stats = storage.compact()
+    assert stats["bytes_reclaimed"] >= 0 and stats["seconds"] >= 0
+    assert isinstance(stats["pending_full"], bool)
+    assert storage.compact(full=True)["pending_full"] is False